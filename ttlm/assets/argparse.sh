@@ -57,8 +57,8 @@ parse_args() {
     key="$1"
     key="${key#--}" # Remove the '--' prefix
 
-    if [[ -n "${ARG_PROPERTIES[$key, help]}" ]]; then
-      if [[ "${ARG_PROPERTIES[$key, type]}" == "bool" ]]; then
+    if [[ -n "${ARG_PROPERTIES[$key,help]}" ]]; then
+      if [[ "${ARG_PROPERTIES[$key,type]}" == "bool" ]]; then
         declare -g "$key"="true"
         shift # past the flag argument
       else
@@ -75,13 +75,13 @@ parse_args() {
   # Check for required arguments
   for arg in "${!ARG_PROPERTIES[@]}"; do
     arg_name="${arg%%,*}" # Extract argument name
-    [[ "${ARG_PROPERTIES[$arg_name, required]}" == "required" && -z "${!arg_name}" ]] && display_error "Missing required argument --$arg_name"
+    [[ "${ARG_PROPERTIES[$arg_name,required]}" == "required" && -z "${!arg_name}" ]] && display_error "Missing required argument --$arg_name"
   done
 
   # Set defaults for any unset arguments
   for arg in "${!ARG_PROPERTIES[@]}"; do
     arg_name="${arg%%,*}" # Extract argument name
-    [[ -z "${!arg_name}" ]] && declare -g "$arg_name"="${ARG_PROPERTIES[$arg_name, default]}"
+    [[ -z "${!arg_name}" ]] && declare -g "$arg_name"="${ARG_PROPERTIES[$arg_name,default]}"
   done
 }
 
@@ -95,7 +95,7 @@ show_help() {
   for arg in "${!ARG_PROPERTIES[@]}"; do
     arg_name="${arg%%,*}" # Extract argument name
     [[ "${arg##*,}" == "help" ]] && {
-      [[ "${ARG_PROPERTIES[$arg_name, type]}" != "bool" ]] && echo "  --$arg_name [TXT]: ${ARG_PROPERTIES[$arg]}" || echo "  --$arg_name: ${ARG_PROPERTIES[$arg]}"
+      [[ "${ARG_PROPERTIES[$arg_name,type]}" != "bool" ]] && echo "  --$arg_name [TXT]: ${ARG_PROPERTIES[$arg]}" || echo "  --$arg_name: ${ARG_PROPERTIES[$arg]}"
     }
   done
 }
@@ -8,7 +8,8 @@ def load(
 ) -> PreTrainingConfig | list[PreTrainingConfig]:
     """Load experiment config by name and optional index.
 
-    Returns either a single config or indexed config from a sweep.
+    Returns either a single config or indexed config from a sweep, or the
+    whole sweep when `experiment_id` is None.
     """
     try:
         module = __import__(f"experiments.{experiment}", fromlist=["CFG"])
@@ -18,6 +19,8 @@ def load(
     config = module.CFG
     if not isinstance(config, list):
         config = [config]
+    if experiment_id is None:
+        return config
 
     if experiment_id >= len(config):
         raise ValueError(
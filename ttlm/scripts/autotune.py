@@ -0,0 +1,260 @@
+"""Find the fastest micro-batch size, sequence length, dtype and thread count that fit.
+
+Builds the experiment's model and times training steps on synthetic tokens
+for increasing micro-batch sizes, without downloading data or training the
+tokenizer. Each probe runs in a fresh process, so its peak memory is measured
+in isolation and an out-of-memory kill only rules out that setting. Results
+are cached per hardware and model config, and the best setting is written
+as a YAML config for `scripts.pretrain --config`.
+"""
+
+import argparse
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from experiments.loader import load as load_experiment
+from ttlm.config import PreTrainingConfig, resolve
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _probe(
+    config: PreTrainingConfig,
+    vocab_size: int,
+    micro_batch_size: int,
+    seq_len: int,
+    num_threads: int | None,
+    warmup: int,
+    steps: int,
+) -> dict:
+    """Times training steps of one setting in this (fresh) process."""
+    import torch
+    import torch.nn.functional as F
+
+    from scripts.pretrain import build_model, get_autocast_dtype
+    from ttlm.optim import build_optimizer, clip_grad_norm
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    device = torch.device(config.device)
+    model = build_model(config, vocab_size).to(device, dtype=config.torch_dtype)
+    optimizer = build_optimizer(model, config.optimizer)
+    autocast_dtype = get_autocast_dtype(config, device)
+    input_ids = torch.randint(vocab_size, (micro_batch_size, seq_len), device=device)
+
+    def step():
+        with torch.autocast(
+            device_type=device.type,
+            dtype=autocast_dtype,
+            enabled=autocast_dtype != torch.float32,
+        ):
+            logits = model(input_ids)
+        loss = F.cross_entropy(
+            logits[:, :-1].reshape(-1, vocab_size), input_ids[:, 1:].reshape(-1)
+        )
+        (loss + config.model.moe_aux_loss_weight * model.aux_loss()).backward()
+        clip_grad_norm(model.parameters(), config.optimizer.max_grad_norm)
+        optimizer.step()
+        optimizer.zero_grad()
+
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+    for _ in range(warmup):
+        step()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+        peak_bytes = torch.cuda.max_memory_allocated(device)
+    else:
+        peak_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    step_time = (time.perf_counter() - start) / steps
+    return {
+        "step_time_sec": step_time,
+        "tokens_per_sec": micro_batch_size * seq_len / step_time,
+        "peak_memory_bytes": peak_bytes,
+    }
+
+
+def hardware_fingerprint(device: str) -> dict:
+    """What the probe results depend on besides the config."""
+    import torch
+
+    info = {
+        "machine": platform.machine(),
+        "cpu": platform.processor(),
+        "cores": len(os.sched_getaffinity(0)),
+        "torch": torch.__version__,
+    }
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as f:
+            names = [line.split(":", 1)[1].strip() for line in f if line.startswith("model name")]
+        info["cpu"] = names[0] if names else info["cpu"]
+    if device == "cuda":
+        props = torch.cuda.get_device_properties(0)
+        info["gpu"] = props.name
+        info["gpu_memory"] = props.total_memory
+    return info
+
+
+def memory_budget(device: str, fraction: float) -> int:
+    """Bytes a probe may peak at: a fraction of GPU memory or of available RAM."""
+    if device == "cuda":
+        import torch
+
+        return int(fraction * torch.cuda.get_device_properties(0).total_memory)
+    with open("/proc/meminfo") as f:
+        meminfo = dict(line.split(":", 1) for line in f)
+    return int(fraction * int(meminfo["MemAvailable"].split()[0]) * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--experiment", type=str, default="default")
+    parser.add_argument("--experiment_id", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Tuned YAML (default: <ckpt_path>/tuned.yaml)")
+    parser.add_argument("--world_size", type=int, default=1, help="Ranks the tuned config will train with")
+    parser.add_argument("--seq_lens", type=int, nargs="+", default=None, help="Sequence lengths to probe (default: data.seq_len or eval.seq_len)")
+    parser.add_argument("--dtypes", type=str, nargs="+", default=None, help="Parameter dtypes to probe (default: float32 and bfloat16)")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="CPU intra-op thread counts to probe (default: all cores / world_size)")
+    parser.add_argument("--max_batch_size", type=int, default=512, help="Largest micro-batch to probe")
+    parser.add_argument("--vocab_size", type=int, default=None, help="Default: untrained tokenizer vocabulary plus num_merges")
+    parser.add_argument("--memory_fraction", type=float, default=0.9, help="Share of device memory a setting may use")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=3)
+    parser.add_argument("--force", action="store_true", help="Ignore cached probe results")
+    args = parser.parse_args()
+
+    config = load_experiment(args.experiment, args.experiment_id)
+    device = config.device
+    vocab_size = args.vocab_size or (
+        resolve(config.tokenizer.module)().vocab_size + config.tokenizer.num_merges
+    )
+    seq_lens = args.seq_lens or [config.data.seq_len or config.eval.seq_len]
+    dtypes = args.dtypes or ["float32", "bfloat16"]
+    cores = len(os.sched_getaffinity(0))
+    threads = (args.threads or [max(1, cores // args.world_size)]) if device == "cpu" else [None]
+    budget = memory_budget(device, args.memory_fraction)
+
+    key = json.dumps(
+        {
+            "hardware": hardware_fingerprint(device),
+            "model": dataclasses.asdict(config.model),
+            "optimizer": dataclasses.asdict(config.optimizer),
+            "cpu": dataclasses.asdict(config.cpu),
+            "device": device,
+            "vocab_size": vocab_size,
+            "steps": [args.warmup, args.steps],
+        },
+        sort_keys=True,
+        default=str,
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(config.data.cache_dir or "logs/cache", f"autotune-{digest}.json")
+    cache = {}
+    if os.path.exists(cache_path) and not args.force:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        logging.info(f"Loaded {len(cache)} cached probes from {cache_path}")
+
+    context = multiprocessing.get_context("spawn")
+    pool = concurrent.futures.ProcessPoolExecutor(1, mp_context=context, max_tasks_per_child=1)
+    for dtype in dtypes:
+        probe_config = dataclasses.replace(config, dtype=dtype)
+        for num_threads in threads:
+            for seq_len in seq_lens:
+                best, stalls, micro_batch_size = 0.0, 0, 1
+                while micro_batch_size <= args.max_batch_size and stalls < 2:
+                    name = f"{dtype}/t{num_threads}/s{seq_len}/b{micro_batch_size}"
+                    if name not in cache:
+                        try:
+                            cache[name] = pool.submit(
+                                _probe,
+                                probe_config,
+                                vocab_size,
+                                micro_batch_size,
+                                seq_len,
+                                num_threads,
+                                args.warmup,
+                                args.steps,
+                            ).result()
+                        except BrokenProcessPool:
+                            # Killed, most likely by the OOM killer.
+                            cache[name] = {"error": "probe process died"}
+                            pool = concurrent.futures.ProcessPoolExecutor(
+                                1, mp_context=context, max_tasks_per_child=1
+                            )
+                        except Exception as e:
+                            cache[name] = {"error": f"{type(e).__name__}: {e}"[:200]}
+                    result = cache[name]
+                    fits = "error" not in result and result["peak_memory_bytes"] <= budget
+                    logging.info(
+                        f"{name}: "
+                        + (
+                            f"{result['tokens_per_sec']:.0f} tokens/s, "
+                            f"{result['step_time_sec'] * 1e3:.1f} ms/step, "
+                            f"{result['peak_memory_bytes'] / 2**30:.2f} GiB"
+                            if "error" not in result
+                            else result["error"]
+                        )
+                    )
+                    if not fits:
+                        break
+                    result.update(
+                        dtype=dtype,
+                        num_threads=num_threads,
+                        seq_len=seq_len,
+                        micro_batch_size=micro_batch_size,
+                    )
+                    # Stop once doubling the batch no longer buys 5% more throughput.
+                    stalls = stalls + 1 if result["tokens_per_sec"] < 1.05 * best else 0
+                    best = max(best, result["tokens_per_sec"])
+                    micro_batch_size *= 2
+    pool.shutdown()
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w") as f:
+        json.dump(cache, f, indent=2)
+
+    candidates = [
+        r
+        for r in cache.values()
+        if "error" not in r
+        and r["peak_memory_bytes"] <= budget
+        and r.get("dtype") in dtypes
+        and r.get("seq_len") in seq_lens
+        and r.get("num_threads") in threads
+    ]
+    if not candidates:
+        raise SystemExit("No setting fits; try smaller --seq_lens or a smaller model")
+    best = max(candidates, key=lambda r: r["tokens_per_sec"])
+
+    config.dtype = best["dtype"]
+    config.data.batch_size = best["micro_batch_size"] * args.world_size
+    config.data.seq_len = best["seq_len"]
+    if device == "cpu":
+        config.cpu.num_threads = best["num_threads"]
+    output = args.output or os.path.join(config.ckpt_path, "tuned.yaml")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    config.to_yaml(output)
+    logging.info(
+        f"Best: {best['dtype']}, micro-batch {best['micro_batch_size']} x seq_len "
+        f"{best['seq_len']}, threads {best['num_threads']}: "
+        f"{best['tokens_per_sec']:.0f} tokens/s per rank. Wrote {output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
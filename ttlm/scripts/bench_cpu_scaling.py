@@ -0,0 +1,127 @@
+"""Measure CPU data-parallel training throughput across ranks x threads layouts.
+
+Every layout trains the same model on synthetic batches with DDP over gloo,
+each rank pinned to its own slice of cores by `World`. The global batch is
+fixed, so tokens/sec is directly comparable between layouts.
+"""
+
+import argparse
+import os
+import socket
+import time
+
+import torch
+import torch.multiprocessing as mp
+import torch.nn.functional as F
+from torch.nn.parallel import DistributedDataParallel as DDP
+
+from ttlm.cpu import available_cores, bf16_supported
+from ttlm.dist import World
+from ttlm.model import Model
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _worker(rank: int, world_size: int, threads: int, port: int, args, results) -> None:
+    """One rank: a few warmup steps, then timed steps; rank 0 reports tokens/sec."""
+    os.environ.update(
+        RANK=str(rank),
+        LOCAL_RANK=str(rank),
+        WORLD_SIZE=str(world_size),
+        LOCAL_WORLD_SIZE=str(world_size),
+        MASTER_ADDR="127.0.0.1",
+        MASTER_PORT=str(port),
+    )
+    with World(device="cpu", backend="gloo", num_threads=threads, pin_cores=True) as world:
+        torch.manual_seed(0)
+        model = Model(
+            vocab_size=args.vocab_size,
+            hidden_dim=args.hidden_dim,
+            num_layers=args.num_layers,
+            num_heads=max(1, args.hidden_dim // 64),
+            ff_dim=4 * args.hidden_dim,
+        )
+        if world.distributed:
+            model = DDP(model)
+        optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4, fused=True)
+        batch_size = args.batch_size // world_size
+        input_ids = torch.randint(args.vocab_size, (batch_size, args.seq_len))
+        dtype = torch.bfloat16 if args.bf16 else torch.float32
+
+        def step():
+            with torch.autocast("cpu", dtype=dtype, enabled=args.bf16):
+                logits = model(input_ids)
+            loss = F.cross_entropy(
+                logits[:, :-1].flatten(0, 1).float(), input_ids[:, 1:].flatten()
+            )
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad(set_to_none=True)
+
+        for _ in range(args.warmup):
+            step()
+        world.barrier()
+        start = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+        world.barrier()
+        elapsed = time.perf_counter() - start
+        if world.is_main_process:
+            results.put(args.steps * args.batch_size * args.seq_len / elapsed)
+
+
+def run(world_size: int, threads: int, args) -> float:
+    """Tokens/sec of one layout."""
+    results = mp.get_context("spawn").SimpleQueue()
+    mp.spawn(
+        _worker,
+        args=(world_size, threads, _free_port(), args, results),
+        nprocs=world_size,
+        join=True,
+    )
+    return results.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ranks", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Threads per rank (default: cores // ranks)")
+    parser.add_argument("--hidden_dim", type=int, default=256)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--vocab_size", type=int, default=4096)
+    parser.add_argument("--batch_size", type=int, default=32, help="Global batch size")
+    parser.add_argument("--seq_len", type=int, default=256)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--no_bf16", dest="bf16", action="store_false", help="Disable bf16 autocast")
+    args = parser.parse_args()
+    args.bf16 = args.bf16 and bf16_supported()
+
+    num_cores = len(available_cores())
+    layouts = []
+    for world_size in args.ranks:
+        if args.batch_size % world_size:
+            continue
+        threads = args.threads or [max(1, num_cores // world_size)]
+        layouts.extend((world_size, t) for t in threads if world_size * t <= num_cores)
+    if not layouts:
+        raise SystemExit(f"No layout fits in {num_cores} cores")
+
+    print(f"{num_cores} cores, bf16 autocast: {args.bf16}")
+    print(f"{'ranks':>5} | {'threads':>7} | {'cores':>5} | {'tokens/sec':>10} | {'speedup':>7}")
+    baseline = None
+    for world_size, threads in layouts:
+        throughput = run(world_size, threads, args)
+        baseline = baseline or throughput
+        print(
+            f"{world_size:>5} | {threads:>7} | {world_size * threads:>5} | "
+            f"{throughput:>10.0f} | {throughput / baseline:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
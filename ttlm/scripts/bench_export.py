@@ -0,0 +1,130 @@
+"""Compare startup and per-token latency of an exported artifact against eager.
+
+Startup is the time of a fresh interpreter until the first generated token:
+importing `ttlm` and `Model.from_ckpt` for eager, loading the artifact with
+`scripts/run_exported.py` for the exported programs. It is reported both as
+wall time and from the end of `import torch`, which both paths pay.
+Per-token latency is measured in-process with greedy decoding, after a warmup
+generation, and the greedy outputs of both paths are checked to agree.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+EAGER_STARTUP = """
+import time
+import torch
+start = time.perf_counter()
+from ttlm.engine import generate
+from ttlm.model import Model
+torch.set_num_threads({threads})
+model, tokenizer = Model.from_ckpt({ckpt!r})
+generate(model, torch.tensor([[tokenizer.bos_token_id]]), max_new_tokens=1, temperature=0)
+print(time.perf_counter() - start)
+"""
+
+EXPORTED_STARTUP = """
+import time
+import torch
+start = time.perf_counter()
+from scripts.run_exported import ExportedLM
+torch.set_num_threads({threads})
+lm = ExportedLM({artifact!r})
+lm.generate(torch.tensor([[lm.bos_token_id]]), max_new_tokens=1, temperature=0)
+print(time.perf_counter() - start)
+"""
+
+
+def startup(code: str, repeats: int) -> tuple[float, float]:
+    """Best wall time of running `code` in a fresh interpreter, and the best
+    time it reports since importing torch."""
+    best_wall, best_after_torch = float("inf"), float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", code], check=True, capture_output=True, text=True
+        )
+        best_wall = min(best_wall, time.perf_counter() - start)
+        best_after_torch = min(best_after_torch, float(result.stdout.split()[-1]))
+    return best_wall, best_after_torch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ckpt", type=str, default="logs/pretrain/default/model.ckpt")
+    parser.add_argument("--artifact", type=str, default=None, help="Exported directory (default: <ckpt dir>/exported)")
+    parser.add_argument("--batch_size", type=int, default=1)
+    parser.add_argument("--prompt_len", type=int, default=32)
+    parser.add_argument("--new_tokens", type=int, default=128)
+    parser.add_argument("--num_threads", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    import os
+
+    import torch
+
+    from scripts.run_exported import ExportedLM
+    from ttlm.engine import generate
+    from ttlm.model import Model
+
+    artifact = args.artifact or os.path.join(os.path.dirname(args.ckpt), "exported")
+    torch.set_num_threads(args.num_threads)
+    eager_startup = startup(
+        EAGER_STARTUP.format(threads=args.num_threads, ckpt=args.ckpt), args.repeats
+    )
+    exported_startup = startup(
+        EXPORTED_STARTUP.format(threads=args.num_threads, artifact=artifact), args.repeats
+    )
+
+    model, _ = Model.from_ckpt(args.ckpt)
+    model.eval()
+    lm = ExportedLM(artifact)
+    torch.manual_seed(0)
+    prompt = torch.randint(
+        lm.metadata["vocab_size"], (args.batch_size, args.prompt_len)
+    )
+
+    def eager():
+        return generate(model, prompt, max_new_tokens=args.new_tokens, temperature=0)[
+            :, args.prompt_len :
+        ]
+
+    def exported():
+        return lm.generate(prompt, max_new_tokens=args.new_tokens, temperature=0)
+
+    def per_token(fn) -> tuple[float, torch.Tensor]:
+        """Best milliseconds per generated token, and the tokens."""
+        output = fn()
+        best = float("inf")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, (time.perf_counter() - start) / args.new_tokens)
+        return best * 1e3, output
+
+    eager_ms, eager_tokens = per_token(eager)
+    exported_ms, exported_tokens = per_token(exported)
+    # Greedy paths can diverge after a near-tie in float rounding, so compare
+    # the tokens up to the first difference rather than requiring equality.
+    mismatch = (eager_tokens != exported_tokens).any(dim=0).nonzero()
+    agree = mismatch[0].item() if len(mismatch) else args.new_tokens
+
+    print(f"backend: {lm.metadata['backend']}, threads: {args.num_threads}, batch: {args.batch_size}")
+    print(f"{'path':<8} | {'startup_s':>9} | {'after_torch_s':>13} | {'ms/token':>8}")
+    for name, (wall, after_torch), ms in [
+        ("eager", eager_startup, eager_ms),
+        ("exported", exported_startup, exported_ms),
+    ]:
+        print(f"{name:<8} | {wall:>9.2f} | {after_torch:>13.3f} | {ms:>8.2f}")
+    print(
+        f"speedup: startup after torch {eager_startup[1] / exported_startup[1]:.2f}x, "
+        f"per token {eager_ms / exported_ms:.2f}x; "
+        f"greedy tokens agree for {agree}/{args.new_tokens} steps"
+    )
+
+
+if __name__ == "__main__":
+    main()
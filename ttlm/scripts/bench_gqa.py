@@ -0,0 +1,60 @@
+"""Benchmark decode KV-cache memory and throughput across KV head counts."""
+
+import argparse
+import time
+
+import torch
+
+from ttlm.engine import generate
+from ttlm.kv_cache import KVCache
+from ttlm.model import Model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hidden_dim", type=int, default=512)
+    parser.add_argument("--num_layers", type=int, default=8)
+    parser.add_argument("--num_heads", type=int, default=8)
+    parser.add_argument("--vocab_size", type=int, default=1024)
+    parser.add_argument("--batch_size", type=int, default=8)
+    parser.add_argument("--prompt_len", type=int, default=128)
+    parser.add_argument("--max_new_tokens", type=int, default=256)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    kv_heads = [h for h in range(args.num_heads, 0, -1) if args.num_heads % h == 0]
+    prompt = torch.randint(
+        args.vocab_size, (args.batch_size, args.prompt_len), device=args.device
+    )
+    print(f"{'kv_heads':>8} | {'kv_cache_MiB':>12} | {'tokens/sec':>10}")
+    for num_kv_heads in kv_heads:
+        model = Model(
+            vocab_size=args.vocab_size,
+            hidden_dim=args.hidden_dim,
+            num_layers=args.num_layers,
+            num_heads=args.num_heads,
+            ff_dim=4 * args.hidden_dim,
+            num_kv_heads=num_kv_heads,
+        ).to(args.device).eval()
+
+        # Cache footprint at the final sequence length of the timed run.
+        seq_len = args.prompt_len + args.max_new_tokens
+        cache = KVCache.for_model(model)
+        with torch.inference_mode():
+            model(prompt.new_zeros(args.batch_size, seq_len), cache=cache)
+        generate(model, prompt, max_new_tokens=4)  # warmup
+
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        generate(model, prompt, max_new_tokens=args.max_new_tokens, top_k=1)
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+
+        throughput = args.batch_size * args.max_new_tokens / elapsed
+        print(f"{num_kv_heads:>8} | {cache.nbytes / 2**20:>12.1f} | {throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
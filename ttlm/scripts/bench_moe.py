@@ -0,0 +1,89 @@
+"""Benchmark MoE layers against a dense model with the same active FLOPs per token.
+
+The dense baseline's MLP has `top_k * ff_dim` hidden units, matching the
+`top_k` experts of `ff_dim` units each that every MoE token runs through.
+"""
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from ttlm.model import Model
+
+
+def bench(model: Model, input_ids: torch.Tensor, iters: int) -> tuple[float, float]:
+    """Mean milliseconds of an inference forward and of a training step."""
+    with torch.inference_mode():
+        model.eval()
+        model(input_ids)
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(input_ids)
+        forward_ms = (time.perf_counter() - start) / iters * 1e3
+
+    model.train()
+    start = time.perf_counter()
+    for _ in range(iters):
+        logits = model(input_ids)
+        loss = F.cross_entropy(logits[:, :-1].flatten(0, 1), input_ids[:, 1:].flatten())
+        (loss + 0.01 * model.aux_loss()).backward()
+        model.zero_grad(set_to_none=True)
+    train_ms = (time.perf_counter() - start) / iters * 1e3
+    return forward_ms, train_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hidden_dim", type=int, default=256)
+    parser.add_argument("--num_layers", type=int, default=4)
+    parser.add_argument("--num_heads", type=int, default=4)
+    parser.add_argument("--ff_dim", type=int, default=512, help="Hidden units per expert")
+    parser.add_argument("--num_experts", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--top_k", type=int, default=2)
+    parser.add_argument("--capacity_factor", type=float, default=1.25)
+    parser.add_argument("--vocab_size", type=int, default=1024)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--seq_len", type=int, default=256)
+    parser.add_argument("--iters", type=int, default=5)
+    parser.add_argument("--num_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    input_ids = torch.randint(args.vocab_size, (args.batch_size, args.seq_len))
+    common = dict(
+        vocab_size=args.vocab_size,
+        hidden_dim=args.hidden_dim,
+        num_layers=args.num_layers,
+        num_heads=args.num_heads,
+        dropout=0.0,
+    )
+    variants = [("dense", Model(ff_dim=args.top_k * args.ff_dim, **common))]
+    for num_experts in args.num_experts:
+        variants.append(
+            (
+                f"moe-{num_experts}x{args.top_k}",
+                Model(
+                    ff_dim=args.ff_dim,
+                    num_experts=num_experts,
+                    moe_top_k=args.top_k,
+                    moe_capacity_factor=args.capacity_factor,
+                    **common,
+                ),
+            )
+        )
+
+    num_tokens = args.batch_size * args.seq_len
+    print(f"{'model':>10} | {'params':>10} | {'fwd_ms':>7} | {'fwd_tok/s':>9} | {'train_ms':>8}")
+    for name, model in variants:
+        forward_ms, train_ms = bench(model, input_ids, args.iters)
+        print(
+            f"{name:>10} | {model.num_parameters:>10,} | {forward_ms:>7.1f} | "
+            f"{num_tokens / forward_ms * 1e3:>9.0f} | {train_ms:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
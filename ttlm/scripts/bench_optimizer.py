@@ -0,0 +1,85 @@
+"""Compare optimizer step time (grad clipping plus AdamW update) across implementations."""
+
+import argparse
+import time
+
+import torch
+
+from ttlm.config import OptimizerConfig
+from ttlm.model import Model
+from ttlm.optim import build_optimizer, clip_grad_norm
+
+
+def legacy_step(model: Model) -> callable:
+    """The previous setup: one group over all parameters and per-parameter loops."""
+    optimizer = torch.optim.AdamW(model.parameters(), lr=6e-4, weight_decay=0.1, foreach=False)
+
+    def step():
+        torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0, foreach=False)
+        optimizer.step()
+
+    return step
+
+
+def factory_step(model: Model, implementation: str) -> callable:
+    """A step through `ttlm.optim` with the given implementation."""
+    config = OptimizerConfig(implementation=implementation)
+    optimizer = build_optimizer(model, config)
+
+    def step():
+        clip_grad_norm(model.parameters(), config.max_grad_norm)
+        optimizer.step()
+
+    return step
+
+
+def bench(step, iters: int, device: str) -> float:
+    """Mean milliseconds per call of `step`."""
+    for _ in range(3):
+        step()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        step()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hidden_dims", type=int, nargs="+", default=[128, 256, 512])
+    parser.add_argument("--vocab_size", type=int, default=4096)
+    parser.add_argument("--iters", type=int, default=20)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    print(
+        f"{'hidden':>6} | {'layers':>6} | {'params':>10} | {'tensors':>7} | "
+        f"{'legacy_ms':>9} | {'for_loop_ms':>11} | {'foreach_ms':>10} | {'fused_ms':>8}"
+    )
+    for hidden_dim in args.hidden_dims:
+        num_layers = max(2, hidden_dim // 64)
+        model = Model(
+            vocab_size=args.vocab_size,
+            hidden_dim=hidden_dim,
+            num_layers=num_layers,
+            num_heads=max(1, hidden_dim // 64),
+            ff_dim=4 * hidden_dim,
+        ).to(args.device)
+        for p in model.parameters():
+            p.grad = torch.randn_like(p)
+
+        times = [bench(legacy_step(model), args.iters, args.device)]
+        for implementation in ("for_loop", "foreach", "fused"):
+            times.append(bench(factory_step(model, implementation), args.iters, args.device))
+        num_tensors = sum(1 for _ in model.parameters())
+        print(
+            f"{hidden_dim:>6} | {num_layers:>6} | {model.num_parameters:>10,} | {num_tensors:>7} | "
+            f"{times[0]:>9.2f} | {times[1]:>11.2f} | {times[2]:>10.2f} | {times[3]:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
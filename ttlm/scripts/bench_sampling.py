@@ -0,0 +1,84 @@
+"""Microbenchmark the batched sampler against the previous top-k sampling path."""
+
+import argparse
+import time
+
+import torch
+import torch.nn.functional as F
+
+from ttlm.sampling import SamplingParams, sample
+
+
+def legacy_sample(logits: torch.Tensor, temperature: float, top_k: int | None) -> torch.Tensor:
+    """The sampling step `engine.generate` used before `ttlm.sampling`."""
+    next_token_logits = logits / temperature
+    if top_k is not None:
+        top_k = min(top_k, logits.size(-1))
+        indices_to_remove = (
+            next_token_logits < torch.topk(next_token_logits, top_k)[0][..., -1, None]
+        )
+        next_token_logits[indices_to_remove] = float("-inf")
+    probs = F.softmax(next_token_logits, dim=-1)
+    return torch.multinomial(probs, num_samples=1)
+
+
+def bench(fn, iters: int, device: str) -> float:
+    """Mean milliseconds per call of `fn`."""
+    for _ in range(3):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--vocab_sizes", type=int, nargs="+", default=[256, 4096, 32768])
+    parser.add_argument("--top_k", type=int, default=50)
+    parser.add_argument("--iters", type=int, default=200)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    print(
+        f"{'batch':>5} | {'vocab':>6} | {'legacy_ms':>9} | {'top_k_ms':>8} | "
+        f"{'per_row_ms':>10} | {'seeded_ms':>9}"
+    )
+    for batch_size in args.batch_sizes:
+        for vocab_size in args.vocab_sizes:
+            logits = torch.randn(batch_size, vocab_size, device=args.device)
+            prev = torch.randint(vocab_size, (batch_size, 64), device=args.device)
+            top_k = SamplingParams.create(batch_size, top_k=args.top_k, device=args.device)
+            # Every row with different filters, as in mixed serving traffic.
+            per_row = SamplingParams.create(
+                batch_size,
+                temperature=torch.linspace(0.0, 1.5, batch_size).tolist(),
+                top_k=[args.top_k * (i % 2) for i in range(batch_size)],
+                top_p=0.9,
+                min_p=0.05,
+                repetition_penalty=1.2,
+                device=args.device,
+            )
+            generators = [
+                torch.Generator(device=args.device).manual_seed(i)
+                for i in range(batch_size)
+            ]
+            times = [
+                bench(lambda: legacy_sample(logits.clone(), 1.0, args.top_k), args.iters, args.device),
+                bench(lambda: sample(logits, top_k), args.iters, args.device),
+                bench(lambda: sample(logits, per_row, prev_tokens=prev), args.iters, args.device),
+                bench(lambda: sample(logits, per_row, generators, prev), args.iters, args.device),
+            ]
+            print(
+                f"{batch_size:>5} | {vocab_size:>6} | {times[0]:>9.3f} | {times[1]:>8.3f} | "
+                f"{times[2]:>10.3f} | {times[3]:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measure cold import time of the CLI entry points with `-X importtime`.
+
+Each target runs in a fresh interpreter. With `--check`, exits non-zero if a
+target exceeds its time budget or a light target imports torch, so startup
+regressions fail fast in CI.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# (name, python args, budget in seconds, must stay torch-free)
+TARGETS = [
+    ("ttlm.config", ["-c", "import ttlm.config"], 0.5, True),
+    ("experiments.default", ["-c", "import experiments.default"], 0.5, True),
+    ("ttlm.tokenizer.ascii", ["-c", "import ttlm.tokenizer.ascii"], 0.5, True),
+    ("ttlm.tokenizer.bpe", ["-c", "import ttlm.tokenizer.bpe"], 0.5, True),
+    ("pretrain --help", ["-m", "scripts.pretrain", "--help"], 0.5, True),
+    ("sweep --help", ["-m", "scripts.sweep", "--help"], 0.5, True),
+    ("vibecheck --help", ["-m", "scripts.vibecheck", "--help"], 0.5, True),
+    ("preprocess --help", ["-m", "scripts.preprocess", "--help"], 0.5, True),
+    ("ttlm.model", ["-c", "import ttlm.model"], None, False),
+]
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Cumulative import time in microseconds per imported module."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:") :].split("|")
+        cumulative[name.strip()] = int(cum)
+    return cumulative
+
+
+def measure(args: list[str], repeats: int) -> tuple[float, dict[str, int]]:
+    """Best wall time over `repeats` runs, and the import profile of the last one."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    best, modules = float("inf"), {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        best = min(best, time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr[-2000:]}")
+        modules = parse_importtime(result.stderr)
+    return best, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per target, best is reported")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest modules shown per target")
+    parser.add_argument("--check", action="store_true", help="Fail if a budget is exceeded")
+    parser.add_argument("--budget_scale", type=float, default=1.0, help="Multiplier on every budget")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'target':<22} | {'wall_s':>6} | {'budget_s':>8} | heaviest imports (ms)")
+    for name, target_args, budget, torch_free in TARGETS:
+        wall, modules = measure(target_args, args.repeats)
+        # Packages rather than submodules, since a parent's time includes its children.
+        top_level = {m: us for m, us in modules.items() if "." not in m}
+        heaviest = sorted(top_level.items(), key=lambda kv: -kv[1])[: args.top]
+        budget = budget * args.budget_scale if budget is not None else None
+        print(
+            f"{name:<22} | {wall:>6.2f} | {budget if budget is not None else '-':>8} | "
+            + ", ".join(f"{m} {us / 1e3:.0f}" for m, us in heaviest)
+        )
+        if budget is not None and wall > budget:
+            failures.append(f"{name} took {wall:.2f}s, budget {budget:.2f}s")
+        if torch_free and "torch" in modules:
+            failures.append(f"{name} imports torch")
+
+    if failures:
+        print("\n".join(["", "Startup regressions:", *failures]))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Convert a multi-head attention checkpoint to grouped-query attention.
+
+Key and value heads are mean-pooled within each group of query heads, which
+is the usual starting point before a short uptraining run.
+"""
+
+import argparse
+
+import torch
+
+from ttlm.model import Model
+
+
+@torch.no_grad()
+def convert_to_gqa(model: Model, num_kv_heads: int) -> Model:
+    """Returns a copy of `model` whose attention layers use `num_kv_heads` KV heads."""
+    if model.num_kv_heads % num_kv_heads != 0:
+        raise ValueError(
+            f"Cannot pool {model.num_kv_heads} KV heads into {num_kv_heads} groups"
+        )
+    converted = Model(
+        vocab_size=model.vocab_size,
+        hidden_dim=model.hidden_dim,
+        num_layers=model.num_layers,
+        num_heads=model.num_heads,
+        ff_dim=model.ff_dim,
+        dropout=model.dropout,
+        softcap=model.softcap,
+        window_size=model.window_sizes,
+        num_kv_heads=num_kv_heads,
+        num_experts=model.num_experts,
+        moe_top_k=model.moe_top_k,
+        moe_capacity_factor=model.moe_capacity_factor,
+    )
+    head_dim = model.hidden_dim // model.num_heads
+    group = model.num_kv_heads // num_kv_heads
+    state_dict = model.state_dict()
+    for name, tensor in state_dict.items():
+        if name.endswith(("k_proj.weight", "k_proj.bias", "v_proj.weight", "v_proj.bias")):
+            pooled = tensor.view(num_kv_heads, group, head_dim, *tensor.shape[1:])
+            state_dict[name] = pooled.mean(dim=1).reshape(
+                num_kv_heads * head_dim, *tensor.shape[1:]
+            )
+    converted.load_state_dict(state_dict)
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ckpt", type=str, required=True, help="Input MHA checkpoint")
+    parser.add_argument("--output", type=str, required=True, help="Output GQA checkpoint")
+    parser.add_argument("--num_kv_heads", type=int, required=True, help="Number of KV heads")
+    args = parser.parse_args()
+
+    model, tokenizer = Model.from_ckpt(args.ckpt)
+    converted = convert_to_gqa(model, args.num_kv_heads)
+    converted.to_ckpt(args.output, tokenizer=tokenizer)
+    print(
+        f"Converted {model.num_kv_heads} -> {converted.num_kv_heads} KV heads, "
+        f"{model.num_parameters:,} -> {converted.num_parameters:,} parameters"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/bin/bash
+source assets/argparse.sh
+
+set_description "Data-parallel pre-training on the CPU cores of one machine (gloo backend)."
+define_arg "experiment" "default_cpu" "The experiment to run" "string" "optional"
+define_arg "experiment_id" "0" "The index of the config (if experiment is a sweep)" "int" "optional"
+define_arg "nproc" "2" "The number of ranks to launch" "int" "optional"
+define_arg "threads_per_rank" "" "Intra-op threads per rank (default: cores / nproc)" "string" "optional"
+define_arg "interop_threads" "1" "Inter-op threads per rank" "int" "optional"
+define_arg "ckpt_path" "" "Override the config's ckpt_path" "string" "optional"
+define_arg "max_restarts" "0" "Restart all ranks this many times if one fails; they resume from last.pt" "int" "optional"
+
+check_for_help "$@"
+parse_args "$@"
+
+extra_args=()
+if [ -n "$threads_per_rank" ]; then
+  extra_args+=("--num_threads=$threads_per_rank")
+fi
+if [ -n "$ckpt_path" ]; then
+  extra_args+=("--ckpt_path=$ckpt_path")
+fi
+
+# Each rank pins itself to its slice of cores and sets its thread pools
+# (see World); these only cap anything started before that happens.
+export OMP_NUM_THREADS=${threads_per_rank:-1}
+export PYTHONUNBUFFERED=1
+
+torchrun --standalone --nnodes=1 --nproc_per_node="$nproc" --max_restarts="$max_restarts" \
+  -m scripts.pretrain \
+  --experiment="$experiment" \
+  --experiment_id="$experiment_id" \
+  --num_interop_threads="$interop_threads" \
+  "${extra_args[@]}"
@@ -0,0 +1,135 @@
+"""Smoke-test elastic training by killing a gloo CPU worker mid-run.
+
+1. Launches `scripts.pretrain` under torchrun's elastic agent with `--nproc`
+   ranks, waits for the first `last.pt` checkpoint and kills one worker. The
+   agent must restart the group, which resumes from `last.pt` and finishes.
+2. With `--rescale_to`, starts the experiment again from scratch, kills the
+   whole job after its first checkpoint and relaunches it with a different
+   number of ranks, which must resume with the same global batch.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _workers(agent_pid: int) -> list[int]:
+    """Pids of the pretrain workers started by the torchrun agent."""
+    with open(f"/proc/{agent_pid}/task/{agent_pid}/children") as f:
+        children = [int(pid) for pid in f.read().split()]
+    workers = []
+    for pid in children:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"scripts.pretrain" in f.read():
+                    workers.append(pid)
+        except FileNotFoundError:
+            pass
+    return workers
+
+
+def launch(args, nproc: int, ckpt_path: str, log_path: str) -> subprocess.Popen:
+    """Starts torchrun with an elastic c10d rendezvous on localhost."""
+    command = [
+        sys.executable,
+        "-m",
+        "torch.distributed.run",
+        "--nnodes=1",
+        f"--nproc_per_node={nproc}",
+        f"--max_restarts={args.max_restarts}",
+        "--rdzv_backend=c10d",
+        f"--rdzv_endpoint=127.0.0.1:{_free_port()}",
+        "-m",
+        "scripts.pretrain",
+        f"--experiment={args.experiment}",
+        f"--experiment_id={args.experiment_id}",
+        f"--ckpt_path={ckpt_path}",
+        f"--checkpoint_interval={args.checkpoint_interval}",
+        "--resume",
+        "--num_threads=1",
+    ]
+    log = open(log_path, "w")
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    return subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+
+
+def wait_for_checkpoint(process: subprocess.Popen, ckpt_path: str, timeout: float) -> None:
+    """Blocks until `last.pt` exists, failing if the run ends or times out first."""
+    path = os.path.join(ckpt_path, "last.pt")
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None:
+            raise SystemExit("Run finished before its first checkpoint; use a longer experiment")
+        if time.monotonic() > deadline:
+            raise SystemExit(f"No checkpoint after {timeout:.0f}s")
+        time.sleep(0.2)
+
+
+def check_log(log_path: str, expected: str) -> None:
+    with open(log_path) as f:
+        text = f.read()
+    if expected not in text:
+        raise SystemExit(f"Expected {expected!r} in {log_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--experiment", type=str, default="default_cpu")
+    parser.add_argument("--experiment_id", type=int, default=0)
+    parser.add_argument("--nproc", type=int, default=2)
+    parser.add_argument("--rescale_to", type=int, default=None, help="Ranks for the relaunch in step 2")
+    parser.add_argument("--checkpoint_interval", type=int, default=5)
+    parser.add_argument("--max_restarts", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output_dir", type=str, default=None, help="Keep checkpoints and logs here")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="elastic_smoke_")
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    ckpt_path = os.path.join(output_dir, "kill_worker")
+    os.makedirs(ckpt_path)
+    log_path = os.path.join(output_dir, "kill_worker.log")
+    process = launch(args, args.nproc, ckpt_path, log_path)
+    wait_for_checkpoint(process, ckpt_path, args.timeout)
+    victim = _workers(process.pid)[-1]
+    print(f"Killing worker {victim}")
+    os.kill(victim, signal.SIGKILL)
+    if process.wait(timeout=args.timeout) != 0:
+        raise SystemExit(f"Elastic run failed, see {log_path}")
+    check_log(log_path, "Resumed from")
+    if not os.path.exists(os.path.join(ckpt_path, "summary.json")):
+        raise SystemExit(f"Run did not finish, see {log_path}")
+    print(f"Restarted after a worker was killed and finished ({log_path})")
+
+    if args.rescale_to is not None:
+        ckpt_path = os.path.join(output_dir, "rescale")
+        os.makedirs(ckpt_path)
+        log_path = os.path.join(output_dir, "rescale_before.log")
+        process = launch(args, args.nproc, ckpt_path, log_path)
+        wait_for_checkpoint(process, ckpt_path, args.timeout)
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=args.timeout)
+
+        log_path = os.path.join(output_dir, "rescale_after.log")
+        process = launch(args, args.rescale_to, ckpt_path, log_path)
+        if process.wait(timeout=args.timeout) != 0:
+            raise SystemExit(f"Rescaled run failed, see {log_path}")
+        check_log(log_path, f"world size {args.nproc} -> {args.rescale_to}")
+        print(f"Resumed with {args.nproc} -> {args.rescale_to} ranks and finished ({log_path})")
+
+
+if __name__ == "__main__":
+    main()
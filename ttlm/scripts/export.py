@@ -0,0 +1,37 @@
+"""Export a checkpoint as a standalone prefill/decode inference artifact.
+
+The artifact directory is loaded and run by `scripts/run_exported.py`, which
+needs neither this package nor the checkpoint. See `ttlm.export` for the
+program signatures.
+"""
+
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ckpt", type=str, help="Path to checkpoint file", default="logs/pretrain/default/model.ckpt")
+    parser.add_argument("--output_dir", type=str, default=None, help="Artifact directory (default: <ckpt dir>/exported)")
+    parser.add_argument("--backend", type=str, default="aoti", choices=["aoti", "export"], help="AOTInductor-compiled or plain torch.export programs")
+    parser.add_argument("--max_seq_len", type=int, default=4096, help="Longest prompt plus generation the programs accept")
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    import os
+
+    from ttlm.export import save_artifact
+    from ttlm.model import Model
+
+    output_dir = args.output_dir or os.path.join(os.path.dirname(args.ckpt), "exported")
+    model, tokenizer = Model.from_ckpt(args.ckpt)
+    model = model.to(args.device)
+    start = time.perf_counter()
+    save_artifact(
+        model, tokenizer, output_dir, max_seq_len=args.max_seq_len, backend=args.backend
+    )
+    print(f"Exported {args.ckpt} to {output_dir} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
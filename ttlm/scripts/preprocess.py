@@ -0,0 +1,93 @@
+"""Clean, deduplicate and tokenize local text corpora into sharded token files.
+
+Reads every input file (directories are searched for `--suffix` files),
+splits documents on `--separator`, normalizes them, drops exact and near
+duplicates and documents outside the length bounds, tokenizes the rest and
+writes `tokens-NNNNN.pt` shards and a `manifest.json` to `--output_dir`.
+See `ttlm.dataset.preprocess`.
+"""
+
+import argparse
+import logging
+
+from ttlm.config import PreprocessConfig, TokenizerConfig
+
+logging.basicConfig(level=logging.INFO)
+
+
+def load_tokenizer(path: str | None, module: str):
+    """The tokenizer pickled at `path` (e.g. pretrain's cached `tokenizer-*.pkl`)
+    or stored in a model checkpoint, else an untrained `module`."""
+    if path is None:
+        from ttlm.config import resolve
+
+        return resolve(module)()
+    if path.endswith(".pkl"):
+        import pickle
+
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    import torch
+
+    return torch.load(path, map_location="cpu", weights_only=False)["tokenizer"]
+
+
+def main():
+    defaults = PreprocessConfig()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("inputs", nargs="+", help="Text files or directories")
+    parser.add_argument("--output_dir", type=str, required=True)
+    parser.add_argument("--suffix", type=str, default=".txt", help="File suffix searched for in directories")
+    parser.add_argument("--tokenizer", type=str, default=None, help="Pickled tokenizer (.pkl) or model checkpoint (default: untrained --tokenizer_module)")
+    parser.add_argument("--tokenizer_module", type=str, default=TokenizerConfig.module)
+    parser.add_argument("--separator", type=str, default=defaults.separator, help="Document separator; empty for one document per file")
+    parser.add_argument("--min_chars", type=int, default=defaults.min_chars)
+    parser.add_argument("--max_chars", type=int, default=defaults.max_chars, help="0 disables the upper bound")
+    parser.add_argument("--no_exact_dedup", dest="exact_dedup", action="store_false")
+    parser.add_argument("--no_near_dedup", dest="near_dedup", action="store_false")
+    parser.add_argument("--num_perm", type=int, default=defaults.num_perm)
+    parser.add_argument("--num_bands", type=int, default=defaults.num_bands)
+    parser.add_argument("--shingle_size", type=int, default=defaults.shingle_size)
+    parser.add_argument("--expected_documents", type=int, default=defaults.expected_documents, help="Sizes the dedup tables")
+    parser.add_argument("--false_positive_rate", type=float, default=defaults.false_positive_rate)
+    parser.add_argument("--num_workers", type=int, default=defaults.num_workers, help="Default: one per core; 0 runs in-process")
+    parser.add_argument("--batch_size", type=int, default=defaults.batch_size, help="Documents per worker task")
+    parser.add_argument("--shard_tokens", type=int, default=defaults.shard_tokens)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    from ttlm.dataset.preprocess import iter_files, preprocess
+
+    config = PreprocessConfig(
+        separator=args.separator or None,
+        min_chars=args.min_chars,
+        max_chars=args.max_chars or None,
+        exact_dedup=args.exact_dedup,
+        near_dedup=args.near_dedup,
+        num_perm=args.num_perm,
+        num_bands=args.num_bands,
+        shingle_size=args.shingle_size,
+        expected_documents=args.expected_documents,
+        false_positive_rate=args.false_positive_rate,
+        num_workers=args.num_workers,
+        batch_size=args.batch_size,
+        shard_tokens=args.shard_tokens,
+        seed=args.seed,
+    )
+    tokenizer = load_tokenizer(args.tokenizer, args.tokenizer_module)
+    manifest = preprocess(
+        iter_files(args.inputs, args.suffix), args.output_dir, tokenizer, config
+    )
+    stats = manifest["stats"]
+    logging.info(
+        f"Kept {stats.get('kept', 0)} of {stats.get('documents', 0)} documents "
+        f"({stats.get('exact_duplicates', 0)} exact and "
+        f"{stats.get('near_duplicates', 0)} near duplicates, "
+        f"{stats.get('too_short', 0)} too short, {stats.get('too_long', 0)} too long), "
+        f"{stats.get('tokens', 0)} tokens in {len(manifest['shards'])} shards, "
+        f"{stats['seconds']:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
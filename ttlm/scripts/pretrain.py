@@ -1,100 +1,400 @@
-"""Main pre-training script."""
+"""Main pre-training script.
+
+Torch and the training modules are imported inside the functions that need
+them, so argument parsing and config loading stay fast.
+"""
+
+from __future__ import annotations
 
 import argparse
+import hashlib
+import json
 import logging
-import token
+import pickle
+import time
 
 logging.basicConfig(level=logging.INFO)
 import os
-
-import torch
-from torch.nn.parallel import DistributedDataParallel as DDP
-from torch.nn.utils.rnn import pad_sequence
-from torch.utils.data import DataLoader
-from torch.utils.data.distributed import DistributedSampler
+from typing import TYPE_CHECKING
 
 from experiments.loader import load as load_experiment
-from ttlm.config import PreTrainingConfig
-from ttlm.dataset.tinystories import TinyStories
-from ttlm.dist import World
-from ttlm.scheduler import get_cos_with_warmup
+from ttlm.config import PreTrainingConfig, resolve
+
+if TYPE_CHECKING:
+    from ttlm.dataset.tinystories import TinyStories
+    from ttlm.dataset.tokenized import TokenizedCorpus
+    from ttlm.tokenizer.base import Tokenizer
+
+
+def load_corpus(
+    config: PreTrainingConfig,
+) -> tuple[TinyStories, TinyStories] | tuple[TokenizedCorpus, TokenizedCorpus]:
+    """Train and held-out splits: of the preprocessed `data.corpus_dir`, or of
+    TinyStories, downloaded once into the shared cache."""
+    if config.data.corpus_dir is not None:
+        from ttlm.dataset.tokenized import TokenizedCorpus
+
+        return tuple(
+            TokenizedCorpus(
+                config.data.corpus_dir,
+                split=split,
+                val_fraction=config.eval.val_fraction,
+                seed=config.eval.seed,
+            )
+            for split in ("train", "val")
+        )
+    from ttlm.dataset.tinystories import TinyStories
+
+    return tuple(
+        TinyStories(
+            split=split,
+            val_fraction=config.eval.val_fraction,
+            seed=config.eval.seed,
+            cache_dir=config.data.cache_dir,
+        )
+        for split in ("train", "val")
+    )
+
+
+def load_tokenizer(
+    config: PreTrainingConfig, dataset: TinyStories | TokenizedCorpus
+) -> Tokenizer:
+    """Trains the tokenizer, or loads it from the cache if an identical one exists.
+
+    The cache key covers everything the trained tokenizer depends on, so runs
+    of a sweep that only differ in model or optimizer share one tokenizer.
+    A preprocessed corpus comes with the tokenizer it was encoded with.
+    """
+    if config.data.corpus_dir is not None:
+        return dataset.tokenizer
+    module = resolve(config.tokenizer.module)
+    key = repr(
+        (
+            f"{module.__module__}.{module.__qualname__}",
+            config.tokenizer.num_merges,
+            dataset.url,
+            dataset.val_fraction,
+            dataset.seed,
+        )
+    )
+    path = None
+    if config.data.cache_dir is not None:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(config.data.cache_dir, f"tokenizer-{digest}.pkl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+    tokenizer = module()
+    texts = []
+    for ii in range(len(dataset)):
+        texts.append(dataset[ii])
+    tokenizer.train(texts, num_merges = config.tokenizer.num_merges)
+    if path is not None:
+        os.makedirs(config.data.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(tokenizer, f)
+        os.replace(tmp_path, path)
+    return tokenizer
+
+
+def build_model(config: PreTrainingConfig, vocab_size: int) -> "torch.nn.Module":
+    """The model described by `config.model`, on the CPU in float32."""
+    return resolve(config.model.module)(
+        vocab_size=vocab_size,
+        hidden_dim=config.model.hidden_dim,
+        num_layers=config.model.num_layers,
+        num_heads=config.model.num_heads,
+        num_kv_heads=config.model.num_kv_heads,
+        ff_dim=config.model.ff_dim,
+        dropout=config.model.dropout,
+        window_size=config.model.window_size,
+        num_experts=config.model.num_experts,
+        moe_top_k=config.model.moe_top_k,
+        moe_capacity_factor=config.model.moe_capacity_factor,
+    )
+
+
+# Top-level config fields that may change when an interrupted run is resumed.
+RESUMABLE_CHANGES = ("ckpt_path", "checkpoint_interval", "resume", "profiler", "cpu")
+
+
+def config_mismatch(saved: dict, config: PreTrainingConfig) -> list[str]:
+    """Top-level fields of `config` that differ from the `saved` run's config."""
+    current = config.to_dict()
+    return [
+        key
+        for key, value in current.items()
+        if key not in RESUMABLE_CHANGES and saved.get(key) != value
+    ]
+
+
+def get_autocast_dtype(config: PreTrainingConfig, device: "torch.device") -> "torch.dtype":
+    """The forward's autocast dtype: `config.dtype`, or bf16 on capable CPUs."""
+    import torch
+
+    from ttlm.cpu import bf16_supported
+
+    if (
+        device.type == "cpu"
+        and config.cpu.bf16_autocast
+        and config.torch_dtype == torch.float32
+        and bf16_supported()
+    ):
+        return torch.bfloat16
+    return config.torch_dtype
 
 
 def pretrain(config: PreTrainingConfig) -> None:
     """Main pre-training loop."""
-    with World(device=config.device) as world:
-        tokenizer = config.tokenizer.module()
-        dataset = TinyStories()
-        
-        texts = []
-        for ii in range(len(dataset)):
-            texts.append(dataset[ii])
-        tokenizer.train(texts, num_merges = config.tokenizer.num_merges)
-        
-        sampler = (
-            DistributedSampler(dataset, drop_last=True) if world.distributed else None
+    import torch
+    from torch.nn.parallel import DistributedDataParallel as DDP
+    from torch.utils.data import DataLoader
+
+    from ttlm.checkpoint import load_training_state, save_training_state
+    from ttlm.dataset.collate import TokenizeCollate
+    from ttlm.dataset.prefetch import DevicePrefetcher
+    from ttlm.dataset.sampler import ResumableSampler
+    from ttlm.dist import World
+    from ttlm.evaluate import build_eval_batches, evaluate
+    from ttlm.metrics import MetricsAccumulator
+    from ttlm.optim import build_optimizer, clip_grad_norm
+    from ttlm.profiler import build_profiler, record_function
+    from ttlm.scheduler import get_cos_with_warmup
+
+    with World(
+        device=config.device,
+        num_threads=config.cpu.num_threads,
+        num_interop_threads=config.cpu.num_interop_threads,
+        pin_cores=config.cpu.pin_cores and config.device == "cpu",
+    ) as world:
+        if config.data.batch_size % world.world_size:
+            raise ValueError(
+                f"Global batch size {config.data.batch_size} is not divisible by "
+                f"world size {world.world_size}"
+            )
+        start_time = time.perf_counter()
+        dataset, val_dataset = load_corpus(config)
+        tokenizer = load_tokenizer(config, dataset)
+        val_batches = build_eval_batches(
+            val_dataset.data,
+            tokenizer,
+            seq_len=config.eval.seq_len,
+            batch_size=config.eval.batch_size,
+            max_tokens=config.eval.max_tokens,
+            rank=world.rank,
+            world_size=world.world_size,
         )
+
+        # Per-rank batches always add up to the same global batch, so a run
+        # restarted with a different number of ranks sees the same data order.
+        sampler = ResumableSampler(
+            len(dataset),
+            global_batch_size=config.data.batch_size,
+            num_replicas=world.world_size,
+            rank=world.rank,
+            shuffle=config.data.shuffle,
+            seed=config.data.seed,
+        )
+        steps_per_epoch = sampler.samples_per_epoch // config.data.batch_size
+        workers = config.data.num_workers > 0
         dataloader = DataLoader(
             dataset,
             batch_size=config.data.batch_size // world.world_size,
             num_workers=config.data.num_workers,
-            pin_memory=config.data.pin_memory,
-            shuffle=False if sampler else config.data.shuffle,
+            collate_fn=TokenizeCollate(
+                tokenizer, seq_len=config.data.seq_len, pack=config.data.pack
+            ),
+            pin_memory=config.data.pin_memory and world.device.type == "cuda",
+            persistent_workers=config.data.persistent_workers and workers,
+            prefetch_factor=config.data.prefetch_factor if workers else None,
             sampler=sampler,
         )
-        model = config.model.module(
-            vocab_size=tokenizer.vocab_size,
-            hidden_dim=config.model.hidden_dim,
-            num_layers=config.model.num_layers,
-            num_heads=config.model.num_heads,
-            ff_dim=config.model.ff_dim,
-            dropout=config.model.dropout,
-        )
-        model.to(world.device, dtype=config.dtype)
+        batches = DevicePrefetcher(dataloader, world.device)
+        model = build_model(config, tokenizer.vocab_size)
+        model.to(world.device, dtype=config.torch_dtype)
+        autocast_dtype = get_autocast_dtype(config, world.device)
+        if world.is_main_process:
+            logging.info(
+                f"Rank 0 of {world.world_size} on {world.device}, "
+                f"{torch.get_num_threads()} threads, cores {world.cores}, "
+                f"autocast {autocast_dtype}"
+            )
         if world.distributed:
-            model = DDP(model, device_ids=[world.local_rank])
-        optimizer = torch.optim.AdamW(
-            params=model.parameters(),
-            lr=config.optimizer.learning_rate,
-            betas=config.optimizer.betas,
-            eps=config.optimizer.eps,
-            weight_decay=config.optimizer.weight_decay,
-        )
+            device_ids = [world.local_rank] if world.device.type == "cuda" else None
+            model = DDP(model, device_ids=device_ids)
+        base_model = model.module if world.distributed else model
+        optimizer = build_optimizer(base_model, config.optimizer)
         lr_scheduler = get_cos_with_warmup(
             optimizer=optimizer,
-            num_warmup_steps=int(config.scheduler.warmup_steps_ratio * len(dataloader)),
-            num_training_steps=config.epochs * len(dataloader),
+            num_warmup_steps=int(config.scheduler.warmup_steps_ratio * steps_per_epoch),
+            num_training_steps=config.epochs * steps_per_epoch,
             min_lr_ratio=config.scheduler.min_lr_ratio,
             num_cycles=config.scheduler.num_cycles,
         )
-        for epoch in range(config.epochs):
-            if world.distributed:
-                sampler.set_epoch(epoch)
-            for i, batch in enumerate(dataloader):
-                model.train()
-                input_ids = tokenizer.encode(batch)
-                tensor_ids = pad_sequence(
-                    input_ids, batch_first=True, padding_value=tokenizer.pad_token_id
-                ).to(world.device)
-                base_model = model.module if world.distributed else model
-                with torch.autocast(device_type=world.device.type, dtype=config.dtype):
-                    logits = base_model(input_ids=tensor_ids)
-                pred_logits = logits[..., :-1, :].reshape(-1, tokenizer.vocab_size)
-                labels = tensor_ids[..., 1:].reshape(-1).to(world.device)
-                loss = torch.nn.functional.cross_entropy(
-                    pred_logits, labels, ignore_index=tokenizer.pad_token_id
+        profiler = build_profiler(
+            config.profiler,
+            output_dir=os.path.join(config.ckpt_path, "profile"),
+            rank=world.rank,
+            device=world.device,
+        )
+        accumulator = MetricsAccumulator(world.device, sum_keys=("tokens",))
+        step, num_tokens, train_metrics = 0, 0, {}
+        start_epoch, epoch_samples = 0, 0
+
+        last_path = os.path.join(config.ckpt_path, "last.pt")
+        state = load_training_state(last_path) if config.resume else None
+        if state is not None:
+            mismatch = config_mismatch(state.get("config", {}), config)
+            if mismatch:
+                raise ValueError(
+                    f"Refusing to resume from {last_path}: its run used a different "
+                    f"{', '.join(mismatch)}; remove it or use another ckpt_path"
+                )
+            base_model.load_state_dict(state["model"])
+            optimizer.load_state_dict(state["optimizer"])
+            lr_scheduler.load_state_dict(state["scheduler"])
+            step, start_epoch = state["step"], state["epoch"]
+            epoch_samples = state["epoch_samples"]
+            if world.is_main_process:
+                logging.info(
+                    f"Resumed from {last_path} at step {step} (epoch {start_epoch + 1}, "
+                    f"{epoch_samples} samples in), world size "
+                    f"{state['world_size']} -> {world.world_size}, "
+                    f"restart {world.restart_count}"
+                )
+
+        def save_last(epoch: int) -> None:
+            """Atomically checkpoints everything needed to resume after `step`."""
+            if world.is_main_process:
+                save_training_state(
+                    last_path,
+                    {
+                        "model": base_model.state_dict(),
+                        "optimizer": optimizer.state_dict(),
+                        "scheduler": lr_scheduler.state_dict(),
+                        "step": step,
+                        "epoch": epoch,
+                        "epoch_samples": epoch_samples,
+                        "samples_seen": step * config.data.batch_size,
+                        "world_size": world.world_size,
+                        "config": config.to_dict(),
+                    },
                 )
-                loss.backward()
-                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-                optimizer.step()
-                lr_scheduler.step()
-                optimizer.zero_grad()
-                if world.is_main_process:
-                    logging.info(f"Epoch {epoch + 1}, last step loss: {loss.item()}")
+            world.barrier()
+
+        interval_start = time.perf_counter()
+
+        def flush_train_metrics(epoch: int) -> dict[str, float]:
+            """Reduces the accumulated metrics across ranks and logs them."""
+            nonlocal interval_start
+            metrics = accumulator.flush()
+            if not metrics:
+                return train_metrics
+            now = time.perf_counter()
+            metrics["tokens_per_sec"] = metrics["tokens"] / (now - interval_start)
+            interval_start = now
+            if world.is_main_process:
+                logging.info(
+                    f"Epoch {epoch + 1}, step {step}: "
+                    + ", ".join(f"{k} {v:.4g}" for k, v in metrics.items())
+                )
+            return metrics
+
+        with profiler:
+            for epoch in range(start_epoch, config.epochs):
+                sampler.set_epoch(epoch, start=epoch_samples)
+                for i, (tensor_ids, batch_tokens) in enumerate(batches):
+                    model.train()
+                    with record_function("forward"):
+                        with torch.autocast(
+                            device_type=world.device.type,
+                            dtype=autocast_dtype,
+                            enabled=autocast_dtype != torch.float32,
+                        ):
+                            logits = model(input_ids=tensor_ids)
+                    with record_function("loss"):
+                        pred_logits = logits[..., :-1, :].reshape(
+                            -1, tokenizer.vocab_size
+                        )
+                        labels = tensor_ids[..., 1:].reshape(-1)
+                        loss = torch.nn.functional.cross_entropy(
+                            pred_logits, labels, ignore_index=tokenizer.pad_token_id
+                        )
+                        aux_loss = base_model.aux_loss()
+                    with record_function("backward"):
+                        (loss + config.model.moe_aux_loss_weight * aux_loss).backward()
+                    with record_function("clip_grad"):
+                        grad_norm = clip_grad_norm(
+                            model.parameters(), config.optimizer.max_grad_norm
+                        )
+                    with record_function("optimizer"):
+                        lr = lr_scheduler.get_last_lr()[0]
+                        optimizer.step()
+                        lr_scheduler.step()
+                        optimizer.zero_grad()
+                    accumulator.update(
+                        loss=loss,
+                        aux_loss=aux_loss,
+                        grad_norm=grad_norm,
+                        tokens=batch_tokens,
+                        lr=lr,
+                    )
+                    profiler.step()
+                    step += 1
+                    epoch_samples += config.data.batch_size
+                    if step % config.log_every_n_steps == 0:
+                        train_metrics = flush_train_metrics(epoch)
+                        num_tokens += train_metrics["tokens"]
+                    if step % config.val_check_interval == 0:
+                        with record_function("validation"):
+                            metrics = evaluate(
+                                base_model,
+                                val_batches,
+                                pad_token_id=tokenizer.pad_token_id,
+                                device=world.device,
+                                dtype=autocast_dtype,
+                            )
+                        if world.is_main_process:
+                            logging.info(f"Step {step}, validation: {metrics}")
+                    if (
+                        config.checkpoint_interval
+                        and step % config.checkpoint_interval == 0
+                    ):
+                        save_last(epoch)
+                epoch_samples = 0
+                if accumulator.steps:
+                    train_metrics = flush_train_metrics(epoch)
+                    num_tokens += train_metrics["tokens"]
+        metrics = evaluate(
+            base_model,
+            val_batches,
+            pad_token_id=tokenizer.pad_token_id,
+            device=world.device,
+            dtype=autocast_dtype,
+        )
         if world.is_main_process:
+            logging.info(f"Final validation: {metrics}")
             logging.info("Pre-training completed successfully, saving model...")
-            os.makedirs(f"logs/{args.experiment}", exist_ok=True)
-            model.to_ckpt(f"logs/{args.experiment}.ckpt", tokenizer=tokenizer)
+            elapsed = time.perf_counter() - start_time
+            base_model.to_ckpt(
+                os.path.join(config.ckpt_path, "model.ckpt"), tokenizer=tokenizer
+            )
+            summary = {
+                "experiment": config.experiment,
+                "num_parameters": base_model.num_parameters,
+                "steps": step,
+                "train_loss": train_metrics.get("loss"),
+                **metrics,
+                "tokens_per_sec": num_tokens / elapsed,
+                "wall_time_sec": elapsed,
+            }
+            with open(os.path.join(config.ckpt_path, "summary.json"), "w") as f:
+                json.dump(summary, f, indent=2)
+            # The run is complete; starting it again should not resume from here.
+            if os.path.exists(last_path):
+                os.remove(last_path)
         world.barrier()
 
 
@@ -102,6 +402,43 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--experiment", type=str, default="default")
     parser.add_argument("--experiment_id", type=int, default=0)
+    parser.add_argument(
+        "--config", type=str, default=None, help="YAML config (e.g. from autotune) instead of an experiment"
+    )
+    parser.add_argument(
+        "--ckpt_path", type=str, default=None, help="Override the config's ckpt_path"
+    )
+    parser.add_argument(
+        "--corpus_dir", type=str, default=None, help="Train on a corpus written by scripts.preprocess"
+    )
+    parser.add_argument(
+        "--checkpoint_interval", type=int, default=None, help="Override steps between last.pt saves"
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="Continue from ckpt_path/last.pt if it exists"
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=None, help="Override intra-op threads per rank"
+    )
+    parser.add_argument(
+        "--num_interop_threads", type=int, default=None, help="Override inter-op threads per rank"
+    )
     args = parser.parse_args()
-    config = load_experiment(args.experiment, args.experiment_id)
+    if args.config is not None:
+        config = PreTrainingConfig.from_yaml(args.config)
+    else:
+        config = load_experiment(args.experiment, args.experiment_id)
+    if args.ckpt_path is not None:
+        config.ckpt_path = args.ckpt_path
+        os.makedirs(config.ckpt_path, exist_ok=True)
+    if args.corpus_dir is not None:
+        config.data.corpus_dir = args.corpus_dir
+    if args.checkpoint_interval is not None:
+        config.checkpoint_interval = args.checkpoint_interval
+    if args.resume:
+        config.resume = True
+    if args.num_threads is not None:
+        config.cpu.num_threads = args.num_threads
+    if args.num_interop_threads is not None:
+        config.cpu.num_interop_threads = args.num_interop_threads
     pretrain(config)
@@ -0,0 +1,162 @@
+"""Generate text from an artifact written by `scripts.export`, using only torch.
+
+This file imports nothing from `ttlm`, so it can be copied next to the
+artifact and run on a serving host without the training package.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from torch import Tensor
+
+
+class ExportedLM:
+    """The prefill/decode programs of an exported model and its token tables."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "metadata.json")) as f:
+            self.metadata = json.load(f)
+        if self.metadata["format_version"] != 1:
+            raise ValueError(f"Unsupported artifact version {self.metadata['format_version']}")
+        self.device = torch.device(self.metadata["device"])
+        self.max_seq_len = self.metadata["max_seq_len"]
+        self.prefill = self._load(os.path.join(path, "prefill.pt2"))
+        self.decode = self._load(os.path.join(path, "decode.pt2"))
+
+        tokenizer = self.metadata["tokenizer"]
+        self.pieces = tokenizer["pieces"]
+        self.bos_token_id = tokenizer["bos_token_id"]
+        self.eos_token_id = tokenizer["eos_token_id"]
+        self.unk_token_id = tokenizer["unk_token_id"]
+        self._ids = {piece: i for i, piece in enumerate(self.pieces) if piece}
+        self._piece_lengths = sorted({len(piece) for piece in self._ids}, reverse=True)
+
+    def _load(self, path: str):
+        """A callable taking and returning flat tuples of tensors."""
+        if self.metadata["backend"] == "aoti":
+            device_index = -1 if self.device.index is None else self.device.index
+            try:
+                # The private C++ loader behind `torch._inductor.aoti_load_package`,
+                # used directly when this torch has it with the known signature:
+                # importing torch._inductor alone takes over a second.
+                loader = torch._C._aoti.AOTIModelPackageLoader(
+                    path, "model", False, 1, device_index
+                )
+            except (AttributeError, TypeError):
+                from torch._inductor import aoti_load_package
+
+                model = aoti_load_package(path, device_index=device_index)
+                return lambda *inputs: tuple(model(*inputs))
+            return lambda *inputs: tuple(loader.boxed_run(list(inputs)))
+        return torch.export.load(path).module()
+
+    def encode(self, text: str, bos: bool = True) -> list[int]:
+        """Greedy longest-match tokenization, as in `BPETokenizer`."""
+        tokens = [self.bos_token_id] if bos else []
+        head = 0
+        while head < len(text):
+            for length in self._piece_lengths:
+                token = self._ids.get(text[head : head + length])
+                if token is not None:
+                    tokens.append(token)
+                    head += length
+                    break
+            else:
+                tokens.append(self.unk_token_id)
+                head += 1
+        return tokens
+
+    def decode_tokens(self, tokens: list[int]) -> str:
+        return "".join(self.pieces[t] if t < len(self.pieces) else "" for t in tokens)
+
+    @torch.inference_mode()
+    def generate(
+        self,
+        input_ids: Tensor,
+        max_new_tokens: int = 100,
+        temperature: float = 1.0,
+        top_k: int | None = None,
+        generator: torch.Generator | None = None,
+    ) -> Tensor:
+        """Samples up to `max_new_tokens` per row of `input_ids` [batch, seq].
+
+        Stops early once every row has produced the EOS token; callers cut
+        each row at its first EOS. Raises ValueError for prompts longer than
+        the artifact's `max_seq_len`, and returns `[batch, 0]` if there is no
+        room left to generate.
+        """
+        if input_ids.size(1) > self.max_seq_len:
+            raise ValueError(
+                f"Prompt of {input_ids.size(1)} tokens is longer than the "
+                f"artifact's max_seq_len of {self.max_seq_len}"
+            )
+        # Compiled programs assume contiguous inputs.
+        input_ids = input_ids.to(self.device).contiguous()
+        max_new_tokens = min(max_new_tokens, self.max_seq_len - input_ids.size(1))
+        if max_new_tokens <= 0:
+            return input_ids.new_empty(input_ids.size(0), 0)
+        logits, keys, values = self.prefill(input_ids)
+        tokens = []
+        done = torch.zeros(input_ids.size(0), dtype=torch.bool, device=self.device)
+        for step in range(max_new_tokens):
+            if temperature == 0:
+                next_token = logits.argmax(dim=-1, keepdim=True)
+            else:
+                logits = logits.float() / temperature
+                if top_k is not None:
+                    kth = torch.topk(logits, min(top_k, logits.size(-1))).values[:, -1:]
+                    logits = logits.masked_fill(logits < kth, float("-inf"))
+                probs = torch.softmax(logits, dim=-1)
+                next_token = torch.multinomial(probs, 1, generator=generator)
+            tokens.append(next_token)
+            done |= next_token[:, 0] == self.eos_token_id
+            if done.all() or step == max_new_tokens - 1:
+                break
+            logits, keys, values = self.decode(next_token, keys, values)
+        return torch.cat(tokens, dim=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--artifact", type=str, default="logs/pretrain/default/exported", help="Directory written by scripts.export")
+    parser.add_argument("--prompt", type=str, default="", help="Text to continue (default: start from BOS)")
+    parser.add_argument("--max_new_tokens", type=int, default=100)
+    parser.add_argument("--temperature", type=float, default=1.0, help="0 decodes greedily")
+    parser.add_argument("--top_k", type=int, default=None)
+    parser.add_argument("--num_samples", type=int, default=1, help="Samples generated as one batch")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--num_threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+    start = time.perf_counter()
+    lm = ExportedLM(args.artifact)
+    print(f"Loaded {args.artifact} in {time.perf_counter() - start:.2f}s")
+
+    generator = None
+    if args.seed is not None:
+        generator = torch.Generator(lm.device).manual_seed(args.seed)
+    prompt = torch.tensor([lm.encode(args.prompt)] * args.num_samples)
+    start = time.perf_counter()
+    output = lm.generate(
+        prompt,
+        max_new_tokens=args.max_new_tokens,
+        temperature=args.temperature,
+        top_k=args.top_k,
+        generator=generator,
+    )
+    elapsed = time.perf_counter() - start
+    for i, row in enumerate(output.tolist()):
+        if lm.eos_token_id in row:
+            row = row[: row.index(lm.eos_token_id)]
+        print(f"\nSample {i + 1}:\n{args.prompt}{lm.decode_tokens(row)}")
+    if output.size(1):
+        print(f"\n{output.size(1)} steps, {elapsed / output.size(1) * 1e3:.2f} ms/token")
+
+
+if __name__ == "__main__":
+    main()
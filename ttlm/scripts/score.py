@@ -0,0 +1,128 @@
+"""Score documents or candidate continuations with a trained checkpoint.
+
+Input is either plain text (one document per line) or JSONL with a ``text``
+field, or ``context`` and ``continuation`` fields to score only the
+continuation. One JSON result per input line is written in input order.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from collections.abc import Iterator
+
+import torch
+import torch.multiprocessing as mp
+
+from ttlm.model import Model
+from ttlm.scoring import ScoreResult, continuation_request, score, text_request
+
+_WORKER = {}
+
+
+def _init_worker(ckpt: str, num_threads: int, args: dict) -> None:
+    """Loads the checkpoint once per worker process."""
+    torch.set_num_threads(num_threads)
+    model, tokenizer = Model.from_ckpt(ckpt)
+    _WORKER.update(model=model.eval(), tokenizer=tokenizer, args=args)
+
+
+def _to_request(tokenizer, line: str, jsonl: bool):
+    if not jsonl:
+        return text_request(tokenizer, line)
+    record = json.loads(line)
+    if "continuation" in record:
+        return continuation_request(
+            tokenizer, record["context"], record["continuation"]
+        )
+    return text_request(tokenizer, record["text"])
+
+
+def _to_record(result: ScoreResult, per_token: bool) -> dict:
+    record = {
+        "logprob": result.logprob,
+        "num_tokens": result.num_tokens,
+        "perplexity": result.perplexity if result.num_tokens else None,
+    }
+    if per_token:
+        record["token_logprobs"] = result.token_logprobs.tolist()
+    return record
+
+
+def _score_chunk(lines: list[str]) -> list[dict]:
+    """Scores one chunk of input lines inside a worker."""
+    model, tokenizer, args = _WORKER["model"], _WORKER["tokenizer"], _WORKER["args"]
+    requests = (_to_request(tokenizer, line, args["jsonl"]) for line in lines)
+    results = score(
+        model,
+        requests,
+        pad_token_id=tokenizer.pad_token_id,
+        max_batch_tokens=args["max_batch_tokens"],
+        buffer_size=len(lines),
+        chunk_size=args["chunk_size"],
+    )
+    return [_to_record(r, args["per_token"]) for r in results]
+
+
+def _chunks(path: str, size: int) -> Iterator[list[str]]:
+    with open(path) as f:
+        lines = (line.rstrip("\n") for line in f if line.strip())
+        while chunk := list(itertools.islice(lines, size)):
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ckpt", type=str, default="logs/pretrain/default/model.ckpt", help="Path to checkpoint file")
+    parser.add_argument("--input", type=str, required=True, help="Text or JSONL file to score")
+    parser.add_argument("--output", type=str, default=None, help="JSONL output file (default: stdout)")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of CPU worker processes")
+    parser.add_argument("--chunk_docs", type=int, default=256, help="Documents per worker task")
+    parser.add_argument("--max_batch_tokens", type=int, default=16384, help="Padded tokens per forward pass")
+    parser.add_argument("--chunk_size", type=int, default=1024, help="Positions per log-softmax chunk")
+    parser.add_argument("--per_token", action="store_true", help="Include per-token log-probs")
+    args = parser.parse_args()
+
+    worker_args = {
+        "jsonl": args.input.endswith(".jsonl"),
+        "max_batch_tokens": args.max_batch_tokens,
+        "chunk_size": args.chunk_size,
+        "per_token": args.per_token,
+    }
+    num_workers = max(1, args.num_workers)
+    num_threads = max(1, len(os.sched_getaffinity(0)) // num_workers)
+    out = open(args.output, "w") if args.output else sys.stdout
+
+    def write(records: list[dict]) -> None:
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+
+    if num_workers == 1:
+        _init_worker(args.ckpt, num_threads, worker_args)
+        for chunk in _chunks(args.input, args.chunk_docs):
+            write(_score_chunk(chunk))
+    else:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(
+            num_workers,
+            initializer=_init_worker,
+            initargs=(args.ckpt, num_threads, worker_args),
+        ) as pool:
+            # Keep a bounded number of chunks in flight so memory does not grow
+            # with the input size, and write results back in input order.
+            pending = deque()
+            for chunk in _chunks(args.input, args.chunk_docs):
+                pending.append(pool.apply_async(_score_chunk, (chunk,)))
+                if len(pending) >= 2 * num_workers:
+                    write(pending.popleft().get())
+            while pending:
+                write(pending.popleft().get())
+
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Run every config of a sweep experiment concurrently on this machine.
+
+Each job is a `scripts.pretrain` subprocess pinned to its own slice of CPU
+cores. Jobs wait in a queue until a slice is free. The corpus and tokenizer
+are prepared once up front and shared through the data cache, and the
+per-run ``summary.json`` files are collected into one table at the end.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+logging.basicConfig(level=logging.INFO)
+
+from experiments.loader import load as load_experiment
+from scripts.pretrain import load_corpus, load_tokenizer
+from ttlm.cpu import available_cores, split_cores
+
+SUMMARY_COLUMNS = (
+    "id",
+    "status",
+    "num_parameters",
+    "steps",
+    "train_loss",
+    "val_loss",
+    "val_ppl",
+    "tokens_per_sec",
+    "wall_time_sec",
+)
+
+
+@dataclass
+class Job:
+    """One config of the sweep and its running process, if any."""
+
+    experiment_id: int
+    ckpt_path: str
+    process: subprocess.Popen | None = None
+    cores: list[int] | None = None
+
+
+def launch(job: Job, experiment: str, cores: list[int]) -> subprocess.Popen:
+    """Starts `job` pinned to `cores`, with matching intra-op thread counts."""
+    env = dict(
+        os.environ,
+        OMP_NUM_THREADS=str(len(cores)),
+        MKL_NUM_THREADS=str(len(cores)),
+    )
+    os.makedirs(job.ckpt_path, exist_ok=True)
+    with open(os.path.join(job.ckpt_path, "stdout.log"), "w") as log:
+        return subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "scripts.pretrain",
+                f"--experiment={experiment}",
+                f"--experiment_id={job.experiment_id}",
+                f"--ckpt_path={job.ckpt_path}",
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            preexec_fn=lambda: os.sched_setaffinity(0, cores),
+        )
+
+
+def summarize(jobs: list[Job], output_path: str) -> None:
+    """Prints the per-job summaries as a table and writes them to CSV."""
+    rows = []
+    for job in jobs:
+        row = {"id": job.experiment_id}
+        path = os.path.join(job.ckpt_path, "summary.json")
+        if job.process.returncode == 0 and os.path.exists(path):
+            with open(path) as f:
+                row.update(json.load(f), status="ok")
+        else:
+            row["status"] = f"failed ({job.process.returncode})"
+        rows.append(row)
+
+    def fmt(value) -> str:
+        return f"{value:.4g}" if isinstance(value, float) else str(value)
+
+    cells = [[fmt(row.get(c, "")) for c in SUMMARY_COLUMNS] for row in rows]
+    widths = [
+        max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(SUMMARY_COLUMNS)
+    ]
+    lines = [" | ".join(c.ljust(w) for c, w in zip(SUMMARY_COLUMNS, widths))]
+    lines.append("-+-".join("-" * w for w in widths))
+    lines += [" | ".join(c.ljust(w) for c, w in zip(r, widths)) for r in cells]
+    print("\n".join(lines))
+
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    logging.info(f"Sweep summary written to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--experiment", type=str, default="default")
+    parser.add_argument("--ids", type=int, nargs="*", default=None, help="Subset of experiment ids to run")
+    parser.add_argument("--max_parallel", type=int, default=None, help="Maximum concurrent jobs (default: one per core slice)")
+    parser.add_argument("--cores_per_job", type=int, default=None, help="CPU cores pinned to each job")
+    parser.add_argument("--output_dir", type=str, default=None, help="Root directory for job outputs")
+    args = parser.parse_args()
+    num_cores = len(available_cores())
+    if args.cores_per_job is not None and not 1 <= args.cores_per_job <= num_cores:
+        parser.error(f"--cores_per_job must be between 1 and the {num_cores} available cores")
+
+    configs = load_experiment(args.experiment, None)
+    ids = args.ids if args.ids is not None else list(range(len(configs)))
+    output_dir = args.output_dir or f"logs/sweep/{args.experiment}"
+
+    for i in ids:
+        dataset, _ = load_corpus(configs[i])
+        load_tokenizer(configs[i], dataset)
+
+    max_parallel = min(len(ids), args.max_parallel or len(ids))
+    cores_per_job = args.cores_per_job or max(1, num_cores // max_parallel)
+    slices = split_cores(max(1, min(max_parallel, num_cores // cores_per_job)), cores_per_job)
+
+    queue = [Job(i, os.path.join(output_dir, str(i))) for i in ids]
+    running: list[Job] = []
+    finished: list[Job] = []
+    while queue or running:
+        for job in list(running):
+            if job.process.poll() is not None:
+                logging.info(f"Job {job.experiment_id} exited with {job.process.returncode}")
+                running.remove(job)
+                finished.append(job)
+                slices.append(job.cores)
+        while queue and slices:
+            job = queue.pop(0)
+            job.cores = slices.pop(0)
+            job.process = launch(job, args.experiment, job.cores)
+            logging.info(f"Job {job.experiment_id} started on cores {job.cores}")
+            running.append(job)
+        time.sleep(1.0)
+
+    finished.sort(key=lambda job: job.experiment_id)
+    summarize(finished, os.path.join(output_dir, "summary.csv"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,27 @@
-import torch
 import argparse
-from ttlm.model import Model
-from ttlm.engine import generate
 
 def main():
     parser = argparse.ArgumentParser(description="Generate samples from a checkpoint")
-    parser.add_argument("--ckpt", type=str, help="Path to checkpoint file", default="logs/default.ckpt")
+    parser.add_argument("--ckpt", type=str, help="Path to checkpoint file", default="logs/pretrain/default/model.ckpt")
     parser.add_argument("--max_new_tokens", type=int, default=100, help="Number of tokens to generate")
     parser.add_argument("--temperature", type=float, default=1.0, help="Sampling temperature")
     parser.add_argument("--top_k", type=int, default=None, help="Top-k sampling")
     parser.add_argument("--num_samples", type=int, default=5, help="Number of samples to generate")
-    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--device", type=str, default=None, help="Device (default: cuda if available)")
+    parser.add_argument("--stream", action="store_true", help="Print text as tokens are generated")
+    parser.add_argument("--profile_dir", type=str, default=None, help="Profile generation and write traces here")
+    parser.add_argument("--profile_active", type=int, default=10, help="Number of profiled tokens per sample")
     args = parser.parse_args()
 
+    import torch
+    from ttlm.model import Model
+    from ttlm.engine import generate, stream
+    from ttlm.config import ProfilerConfig
+    from ttlm.profiler import build_profiler
+
+    if args.device is None:
+        args.device = "cuda" if torch.cuda.is_available() else "cpu"
+
     print(f"Loading model from {args.ckpt}")
     model, tokenizer = Model.from_ckpt(args.ckpt)
     model = model.to(args.device)
@@ -26,18 +35,45 @@ def main():
         # Start with token 0 (unconditional generation)
         input_ids = torch.tensor([[0]], dtype=torch.long, device=args.device)
 
-        output_ids = generate(
-            model=model,
-            input_ids=input_ids,
-            max_new_tokens=args.max_new_tokens,
-            temperature=args.temperature,
-            top_k=args.top_k,
+        profiler = build_profiler(
+            ProfilerConfig(
+                enabled=args.profile_dir is not None,
+                wait=0,
+                warmup=0,
+                active=args.profile_active,
+            ),
+            output_dir=args.profile_dir or "",
+            device=args.device,
         )
+        if args.stream:
+            print(f"\nSample {i + 1}:")
+            tokens = stream(
+                model=model,
+                input_ids=input_ids,
+                max_new_tokens=args.max_new_tokens,
+                temperature=args.temperature,
+                top_k=args.top_k,
+                stop_token_id=tokenizer.eos_token_id,
+            )
+            for text in tokenizer.decode_stream(t[0].item() for t in tokens):
+                print(text, end="", flush=True)
+            print()
+            continue
+
+        with profiler:
+            output_ids = generate(
+                model=model,
+                input_ids=input_ids,
+                max_new_tokens=args.max_new_tokens,
+                temperature=args.temperature,
+                top_k=args.top_k,
+                profiler=profiler,
+            )
 
         generated_tokens = output_ids[0].tolist()
         print(f"\nSample {i + 1}:")
         print(f"Tokens: {generated_tokens}")
-        print(f"Text: {tokenizer.decode(generated_tokens)}")
+        print(f"Text: {tokenizer.decode([generated_tokens])[0]}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,137 @@
+import pytest
+import torch
+
+from ttlm.engine import generate
+from ttlm.kv_cache import KVCache
+from ttlm.model import Model
+from ttlm.prefix_cache import PrefixCache
+
+NUM_LAYERS, NUM_HEADS, HIDDEN_DIM = 2, 2, 32
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return Model(
+        vocab_size=64,
+        hidden_dim=HIDDEN_DIM,
+        num_layers=NUM_LAYERS,
+        num_heads=NUM_HEADS,
+        ff_dim=64,
+        dropout=0.0,
+    ).eval()
+
+
+def token_bytes() -> int:
+    """Keys and values stored per cached token."""
+    return 2 * NUM_LAYERS * HIDDEN_DIM * 4
+
+
+def prefill(model, prefix_cache: PrefixCache, tokens: list[int]) -> torch.Tensor:
+    """Runs `tokens` through `generate`, which adds them to the prefix cache."""
+    return generate(
+        model,
+        torch.tensor([tokens]),
+        max_new_tokens=1,
+        temperature=0,
+        prefix_cache=prefix_cache,
+    )
+
+
+def nodes(prefix_cache: PrefixCache) -> list:
+    stack, found = list(prefix_cache._root.children.values()), []
+    while stack:
+        node = stack.pop()
+        found.append(node)
+        stack.extend(node.children.values())
+    return found
+
+
+def test_lookup_returns_longest_prefix(model):
+    prefix_cache = PrefixCache()
+    prompt = list(range(1, 11))
+    prefill(model, prefix_cache, prompt)
+
+    cache, matched = prefix_cache.lookup(model, prompt[:6] + [40, 41])
+    assert matched == 6
+    assert cache.seq_len == 6
+
+    # The seeded keys are the ones a full prefill computes for those positions.
+    full = KVCache.for_model(model)
+    with torch.no_grad():
+        model(torch.tensor([prompt]), cache=full)
+    for layer, full_layer in zip(cache.layers, full.layers):
+        torch.testing.assert_close(layer.keys[:, :, :6], full_layer.keys[:, :, :6])
+        torch.testing.assert_close(layer.values[:, :, :6], full_layer.values[:, :, :6])
+
+    assert prefix_cache.lookup(model, [50, 51, 52])[1] == 0
+
+
+def test_lookup_leaves_last_token_uncached(model):
+    prefix_cache = PrefixCache()
+    prompt = [1, 2, 3, 4]
+    prefill(model, prefix_cache, prompt)
+    assert prefix_cache.lookup(model, prompt)[1] == len(prompt) - 1
+
+
+def test_insert_splits_shared_edge(model):
+    prefix_cache = PrefixCache()
+    prefill(model, prefix_cache, [1, 2, 3, 4, 5])
+    prefill(model, prefix_cache, [1, 2, 3, 7, 8])
+
+    (shared,) = prefix_cache._root.children.values()
+    assert shared.tokens == (1, 2, 3)
+    assert {child.tokens for child in shared.children.values()} == {(4, 5), (7, 8)}
+    assert all(child.parent is shared for child in shared.children.values())
+    assert shared.keys[0].size(1) == 3
+    assert prefix_cache.nbytes == sum(node.nbytes for node in nodes(prefix_cache))
+    assert prefix_cache.nbytes == 7 * token_bytes()
+
+    assert prefix_cache.lookup(model, [1, 2, 3, 7, 8, 9])[1] == 5
+    assert prefix_cache.lookup(model, [1, 2, 9])[1] == 2
+
+
+def test_evicts_least_recently_used_leaf(model):
+    prefix_cache = PrefixCache(max_bytes=8 * token_bytes())
+    first, second, third = [1, 2, 3, 4], [5, 6, 7, 8], [9, 10, 11, 12]
+    prefill(model, prefix_cache, first)
+    prefill(model, prefix_cache, second)
+    assert prefix_cache.stats()["evictions"] == 0
+    # Touch the first prompt so the second is the least recently used.
+    assert prefix_cache.lookup(model, first)[1] == 3
+
+    prefill(model, prefix_cache, third)
+    assert prefix_cache.nbytes <= prefix_cache.max_bytes
+    assert prefix_cache.stats()["evictions"] == 1
+    assert prefix_cache.lookup(model, first + [0])[1] == 4
+    assert prefix_cache.lookup(model, second + [0])[1] == 0
+    assert prefix_cache.lookup(model, third + [0])[1] == 4
+
+
+def test_stats(model):
+    prefix_cache = PrefixCache()
+    prefill(model, prefix_cache, [1, 2, 3, 4])  # miss, 4 prompt tokens
+    prefill(model, prefix_cache, [1, 2, 3, 4, 5, 6])  # reuses 4 of 6
+    prefill(model, prefix_cache, [7, 8])  # miss
+
+    stats = prefix_cache.stats()
+    assert stats["requests"] == 3
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+    assert stats["reused_tokens"] == 4
+    assert stats["token_hit_rate"] == pytest.approx(4 / 12)
+    assert stats["nbytes"] == (6 + 2) * token_bytes()
+    assert stats["evictions"] == 0
+
+
+def test_generate_matches_uncached(model):
+    prefix_cache = PrefixCache()
+    system = [3, 1, 4, 1, 5, 9, 2, 6]
+    prompts = [system + [5, 3], system + [5, 8, 9], system[:5] + [7], system + [5, 3]]
+    for prompt in prompts:
+        input_ids = torch.tensor([prompt])
+        expected = generate(model, input_ids, max_new_tokens=8, temperature=0)
+        cached = generate(
+            model, input_ids, max_new_tokens=8, temperature=0, prefix_cache=prefix_cache
+        )
+        assert torch.equal(cached, expected)
+    assert prefix_cache.stats()["hit_rate"] == pytest.approx(3 / 4)
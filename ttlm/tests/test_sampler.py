@@ -0,0 +1,55 @@
+import pytest
+
+from ttlm.dataset.sampler import ResumableSampler
+
+NUM_SAMPLES, GLOBAL_BATCH = 100, 12
+
+
+def global_batches(world_size: int, epoch: int, start: int = 0) -> list[list[int]]:
+    """The global batch of every step, gathered from each rank's batches."""
+    per_rank = []
+    for rank in range(world_size):
+        sampler = ResumableSampler(
+            NUM_SAMPLES, GLOBAL_BATCH, num_replicas=world_size, rank=rank, seed=3
+        )
+        sampler.set_epoch(epoch, start=start)
+        indices = list(sampler)
+        assert len(indices) == len(sampler)
+        batch_size = GLOBAL_BATCH // world_size
+        per_rank.append(
+            [indices[i : i + batch_size] for i in range(0, len(indices), batch_size)]
+        )
+    return [sum(step, []) for step in zip(*per_rank)]
+
+
+@pytest.mark.parametrize("before, after", [(2, 4), (4, 3), (3, 1)])
+def test_resume_with_different_world_size(before, after):
+    stop = 3  # global batches trained before the interruption
+    reference = global_batches(1, epoch=1)
+    first = global_batches(before, epoch=1)[:stop]
+    rest = global_batches(after, epoch=1, start=stop * GLOBAL_BATCH)
+    batches = first + rest
+
+    assert all(len(batch) == GLOBAL_BATCH for batch in batches)
+    assert [sorted(b) for b in batches] == [sorted(b) for b in reference]
+    seen = sum(batches, [])
+    assert len(seen) == len(set(seen)) == NUM_SAMPLES // GLOBAL_BATCH * GLOBAL_BATCH
+
+
+def test_epochs_are_distinct_permutations():
+    first, second = global_batches(2, epoch=0), global_batches(2, epoch=1)
+    for batches in (first, second):
+        seen = sum(batches, [])
+        assert len(seen) == len(set(seen))
+    assert first != second
+
+
+def test_rejects_partial_batch_start():
+    sampler = ResumableSampler(NUM_SAMPLES, GLOBAL_BATCH, num_replicas=2)
+    with pytest.raises(ValueError):
+        sampler.set_epoch(0, start=GLOBAL_BATCH + 1)
+
+
+def test_rejects_indivisible_global_batch():
+    with pytest.raises(ValueError):
+        ResumableSampler(NUM_SAMPLES, GLOBAL_BATCH, num_replicas=5)
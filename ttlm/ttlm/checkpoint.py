@@ -0,0 +1,21 @@
+"""Training-state checkpoints for resuming interrupted runs."""
+
+import os
+from typing import Any
+
+import torch
+
+
+def save_training_state(path: str, state: dict[str, Any]) -> None:
+    """Writes `state` atomically, so a crash mid-write never corrupts `path`."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_training_state(path: str) -> dict[str, Any] | None:
+    """The state saved at `path`, or None if there is none yet."""
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location="cpu", weights_only=False)
@@ -1,22 +1,32 @@
-"""Poor man's configuration system."""
+"""Poor man's configuration system.
 
+Kept free of heavy imports (torch, yaml, the model) so that loading an
+experiment, or running `--help`, is fast. Classes are referenced by dotted
+path and resolved on use with `resolve`.
+"""
+
+import importlib
 import os
 from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Literal
+from typing import TYPE_CHECKING, Literal
 import warnings
 
-import torch
-import yaml
-
-import ttlm.model
-import ttlm.tokenizer.ascii
-import ttlm.tokenizer.bpe
+if TYPE_CHECKING:
+    import torch
 
 HIDDEN_DIM_DIVISOR = 64
 FF_DIM_MULTIPLIER = 4
 
 
+def resolve(obj: str | type) -> type:
+    """Returns the class named by a dotted path, or `obj` if it is already one."""
+    if not isinstance(obj, str):
+        return obj
+    module_name, _, name = obj.rpartition(".")
+    return getattr(importlib.import_module(module_name), name)
+
+
 @dataclass
 class DataConfig:
     """Configuration for data loading and processing."""
@@ -25,14 +35,27 @@ class DataConfig:
     num_workers: int = 0
     pin_memory: bool = False
     shuffle: bool = True
+    seed: int = 0
+    cache_dir: str | None = "logs/cache"
+    # Train on a corpus written by `scripts.preprocess`, with its tokenizer,
+    # instead of TinyStories.
+    corpus_dir: str | None = None
+    # Worker processes are kept alive across epochs and each keeps
+    # `prefetch_factor` tokenized batches ready. Both only apply with workers.
+    persistent_workers: bool = True
+    prefetch_factor: int = 2
+    # Truncate stories to `seq_len` tokens, or with `pack` concatenate them
+    # into full rows of `seq_len` tokens instead of padding.
+    seq_len: int | None = None
+    pack: bool = False
 
 
 @dataclass
 class TokenizerConfig:
     """Configuration for tokenizer."""
 
-    # module: type[ttlm.tokenizer.base.Tokenizer] = ttlm.tokenizer.ascii.AsciiTokenizer
-    module: type[ttlm.tokenizer.base.Tokenizer] = ttlm.tokenizer.bpe.BPETokenizer
+    # module: str | type = "ttlm.tokenizer.ascii.AsciiTokenizer"
+    module: str | type = "ttlm.tokenizer.bpe.BPETokenizer"
     num_merges: int = 100
 
 
@@ -40,13 +63,24 @@ class TokenizerConfig:
 class ModelConfig:
     """Configuration for the model architecture."""
 
-    module: type[torch.nn.Module] = ttlm.model.Model
+    module: str | type = "ttlm.model.Model"
     hidden_dim: int = 128
     num_layers: int | None = None
     num_heads: int | None = None
+    num_kv_heads: int | None = None  # grouped-query attention; None for num_heads
     ff_dim: int | None = None
     dropout: float = 0.1
     num_parameters: int | None = None
+    # Sliding-window attention: one size for every layer, or one per layer
+    # (None for full attention).
+    window_size: int | list[int | None] | None = None
+    # Mixture-of-experts MLP: experts per layer, for every layer or one per
+    # layer (None for a dense SwiGLU). Each expert has `ff_dim` hidden units
+    # and every token is routed to `moe_top_k` of them.
+    num_experts: int | list[int | None] | None = None
+    moe_top_k: int = 2
+    moe_capacity_factor: float = 1.25
+    moe_aux_loss_weight: float = 0.01
 
 
 @dataclass
@@ -58,6 +92,9 @@ class OptimizerConfig:
     weight_decay: float = 0.1
     betas: tuple[float, float] = (0.9, 0.95)
     eps: float = 1e-8
+    implementation: Literal["fused", "foreach", "for_loop"] = "fused"
+    # Gradients are clipped to this total norm; None only measures the norm.
+    max_grad_norm: float | None = 1.0
 
 
 @dataclass
@@ -69,6 +106,75 @@ class SchedulerConfig:
     num_cycles: float = 0.5
 
 
+@dataclass
+class EvalConfig:
+    """Configuration for periodic held-out evaluation."""
+
+    val_fraction: float = 0.01
+    seed: int = 0
+    batch_size: int = 128
+    seq_len: int = 256
+    max_tokens: int | None = 2**18
+
+
+@dataclass
+class ProfilerConfig:
+    """Configuration for `torch.profiler` step-window profiling."""
+
+    enabled: bool = False
+    wait: int = 5
+    warmup: int = 2
+    active: int = 5
+    repeat: int = 1
+    record_shapes: bool = True
+    profile_memory: bool = True
+    with_stack: bool = False
+    sort_by: str | None = None
+    row_limit: int = 30
+
+
+@dataclass
+class CPUConfig:
+    """Configuration for training on CPU, with one or several ranks per machine."""
+
+    # Intra-op threads per rank; None shares the cores evenly between ranks.
+    num_threads: int | None = None
+    num_interop_threads: int | None = None
+    # Pin each rank to its own slice of cores, NUMA node by node.
+    pin_cores: bool = True
+    # Run the forward in bfloat16 autocast when the CPU supports it natively,
+    # keeping float32 parameters and optimizer state.
+    bf16_autocast: bool = True
+
+
+@dataclass
+class PreprocessConfig:
+    """Configuration for cleaning, deduplicating and tokenizing local corpora."""
+
+    # Documents are split on `separator`; None makes every file one document.
+    separator: str | None = "<|endoftext|>"
+    # Normalized documents outside [min_chars, max_chars] are dropped.
+    min_chars: int = 20
+    max_chars: int | None = 200_000
+    exact_dedup: bool = True
+    # Near-duplicates: MinHash over word `shingle_size`-grams, split into
+    # `num_bands` LSH bands (similarity threshold about (1/b) ** (b/num_perm)).
+    near_dedup: bool = True
+    num_perm: int = 128
+    num_bands: int = 16
+    shingle_size: int = 5
+    # The dedup tables are Bloom filters sized for `expected_documents` at this
+    # false positive rate, so memory stays fixed however large the corpus is.
+    expected_documents: int = 1_000_000
+    false_positive_rate: float = 1e-3
+    # Worker processes (None: one per core, 0: in-process), documents per task
+    # and tokens per output shard.
+    num_workers: int | None = None
+    batch_size: int = 256
+    shard_tokens: int = 2**24
+    seed: int = 0
+
+
 @dataclass
 class PreTrainingConfig:
     """Top-level configuration for a training run."""
@@ -81,12 +187,23 @@ class PreTrainingConfig:
     optimizer: OptimizerConfig = field(default_factory=OptimizerConfig)
     scheduler: SchedulerConfig = field(default_factory=SchedulerConfig)
     tokenizer: TokenizerConfig = field(default_factory=TokenizerConfig)
+    eval: EvalConfig = field(default_factory=EvalConfig)
+    profiler: ProfilerConfig = field(default_factory=ProfilerConfig)
+    cpu: CPUConfig = field(default_factory=CPUConfig)
 
     epochs: int = 30
     device: Literal["cuda", "cpu"] = "cuda"
-    dtype: torch.dtype = torch.float32
+    dtype: "str | torch.dtype" = "float32"
     max_steps: int | float = float("inf")
     val_check_interval: int = 2048
+    # Training metrics are reduced across ranks and logged every this many steps.
+    log_every_n_steps: int = 10
+    # Save `last.pt` in ckpt_path every this many steps (None to disable) and,
+    # with `resume`, continue from it when the run is started again. It is
+    # removed once the run completes, and resuming a run whose config differs
+    # is refused.
+    checkpoint_interval: int | None = 500
+    resume: bool = False
     max_flops: int | None = None
 
     def __post_init__(self) -> None:
@@ -107,8 +224,19 @@ class PreTrainingConfig:
 
         os.makedirs(self.ckpt_path, exist_ok=True)
 
+    @property
+    def torch_dtype(self) -> "torch.dtype":
+        """`dtype` as a `torch.dtype`, whether given as one or by name."""
+        import torch
+
+        if isinstance(self.dtype, str):
+            return getattr(torch, self.dtype.replace("torch.", ""))
+        return self.dtype
+
     def to_yaml(self, path: str | Path) -> None:
         """Save configuration to YAML file."""
+        import yaml
+
         data = self.to_dict()
         with open(path, "w") as f:
             yaml.dump(data, f, default_flow_style=False, sort_keys=False)
@@ -124,6 +252,8 @@ class PreTrainingConfig:
     @classmethod
     def from_yaml(cls, path: str | Path) -> "PreTrainingConfig":
         """Load configuration from YAML file."""
+        import yaml
+
         with open(path) as f:
             data = yaml.unsafe_load(f)
         data["data"] = DataConfig(**data["data"])
@@ -131,7 +261,9 @@ class PreTrainingConfig:
         data["optimizer"] = OptimizerConfig(**data["optimizer"])
         data["scheduler"] = SchedulerConfig(**data["scheduler"])
         data["tokenizer"] = TokenizerConfig(**data["tokenizer"])
+        data["eval"] = EvalConfig(**data.get("eval", {}))
+        data["profiler"] = ProfilerConfig(**data.get("profiler", {}))
+        data["cpu"] = CPUConfig(**data.get("cpu", {}))
         if "dtype" in data and isinstance(data["dtype"], str):
-            dtype_str = data["dtype"].replace("torch.", "")
-            data["dtype"] = getattr(torch, dtype_str)
+            data["dtype"] = data["dtype"].replace("torch.", "")
         return cls(**data)
@@ -0,0 +1,61 @@
+"""CPU topology helpers for pinning jobs and ranks to cores."""
+
+import glob
+import os
+import re
+
+
+def available_cores() -> list[int]:
+    """Cores this process may run on, in ascending order."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _parse_cpulist(text: str) -> list[int]:
+    """Parses a sysfs cpulist such as ``0-3,8-11``."""
+    cores = []
+    for part in filter(None, text.strip().split(",")):
+        lo, _, hi = part.partition("-")
+        cores.extend(range(int(lo), int(hi or lo) + 1))
+    return cores
+
+
+def numa_nodes() -> list[list[int]]:
+    """Available cores grouped by NUMA node; a single group if unknown."""
+    allowed = set(available_cores())
+    nodes = []
+    paths = glob.glob("/sys/devices/system/node/node[0-9]*/cpulist")
+    for path in sorted(paths, key=lambda p: int(re.findall(r"node(\d+)", p)[-1])):
+        with open(path) as f:
+            cores = [c for c in _parse_cpulist(f.read()) if c in allowed]
+        if cores:
+            nodes.append(cores)
+    return nodes or [sorted(allowed)]
+
+
+def split_cores(num_slices: int, cores_per_slice: int | None = None) -> list[list[int]]:
+    """Splits the available cores into `num_slices` disjoint slices.
+
+    Cores are taken node by node, so a slice only spans NUMA nodes when it
+    cannot fit in one. Without `cores_per_slice`, cores are shared out evenly.
+    """
+    cores = [c for node in numa_nodes() for c in node]
+    if cores_per_slice is None:
+        cores_per_slice = max(1, len(cores) // num_slices)
+    if num_slices * cores_per_slice > len(cores):
+        raise ValueError(
+            f"Cannot fit {num_slices} slices of {cores_per_slice} cores "
+            f"into {len(cores)} available cores"
+        )
+    return [
+        cores[i * cores_per_slice : (i + 1) * cores_per_slice]
+        for i in range(num_slices)
+    ]
+
+
+def bf16_supported() -> bool:
+    """True if this CPU has native bfloat16 matmul support (AVX512-BF16 or AMX)."""
+    import torch
+
+    return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
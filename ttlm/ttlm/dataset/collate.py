@@ -0,0 +1,48 @@
+"""Batch collation that tokenizes inside DataLoader workers."""
+
+import torch
+from torch import Tensor
+from torch.nn.utils.rnn import pad_sequence
+from torch.profiler import record_function
+
+from ttlm.dataset.packing import pack
+from ttlm.tokenizer.base import Tokenizer
+
+
+class TokenizeCollate:
+    """Tokenizes a list of stories and pads, or packs, them into one batch.
+
+    Used as the DataLoader's `collate_fn`, so tokenization runs in the worker
+    processes instead of between training steps. Returns the `[batch, seq]`
+    input ids and the number of non-pad tokens, counted on the CPU so the
+    training loop never syncs with the device for it. With `pack`, stories
+    are concatenated into rows of exactly `seq_len` tokens; otherwise they
+    are padded to the longest one, truncated to `seq_len` if it is set.
+    Stories that are already token tensors are not tokenized again.
+    """
+
+    def __init__(
+        self, tokenizer: Tokenizer, seq_len: int | None = None, pack: bool = False
+    ):
+        if pack and seq_len is None:
+            raise ValueError("Packing requires a seq_len")
+        self.tokenizer = tokenizer
+        self.seq_len = seq_len
+        self.pack = pack
+
+    def __call__(self, stories: list[str] | list[Tensor]) -> tuple[Tensor, int]:
+        if isinstance(stories[0], Tensor):
+            # Already tokenized, e.g. by `TokenizedCorpus`.
+            input_ids = stories
+        else:
+            with record_function("tokenize"):
+                input_ids = self.tokenizer.encode(stories)
+        pad_token_id = self.tokenizer.pad_token_id
+        if self.pack:
+            batch = pack(input_ids, self.seq_len, pad_token_id)
+        else:
+            if self.seq_len is not None:
+                input_ids = [ids[: self.seq_len] for ids in input_ids]
+            batch = pad_sequence(input_ids, batch_first=True, padding_value=pad_token_id)
+        num_tokens = int(torch.count_nonzero(batch != pad_token_id))
+        return batch, num_tokens
@@ -0,0 +1,19 @@
+"""Sequence packing helpers."""
+
+from collections.abc import Iterable
+
+import torch
+from torch import Tensor
+
+
+def pack(sequences: Iterable[Tensor], seq_len: int, pad_token_id: int) -> Tensor:
+    """Concatenates token sequences and cuts them into rows of `seq_len` tokens.
+
+    Documents keep their BOS/EOS markers, so rows may span document boundaries;
+    only the final row is padded. Returns a `[num_rows, seq_len]` LongTensor.
+    """
+    flat = torch.cat([torch.as_tensor(s, dtype=torch.long) for s in sequences])
+    num_rows = -(-flat.numel() // seq_len)
+    padded = flat.new_full((num_rows * seq_len,), pad_token_id)
+    padded[: flat.numel()] = flat
+    return padded.view(num_rows, seq_len)
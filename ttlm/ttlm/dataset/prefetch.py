@@ -0,0 +1,75 @@
+"""Overlap host-to-device batch copies with compute."""
+
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import torch
+
+
+def _to_device(batch: Any, device: torch.device, pin: bool) -> Any:
+    """Moves every tensor in a (nested) batch to `device` without blocking."""
+    if isinstance(batch, torch.Tensor):
+        if pin and not batch.is_pinned():
+            batch = batch.pin_memory()
+        return batch.to(device, non_blocking=True)
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_to_device(b, device, pin) for b in batch)
+    if isinstance(batch, dict):
+        return {k: _to_device(v, device, pin) for k, v in batch.items()}
+    return batch
+
+
+def _record_stream(batch: Any, stream: torch.cuda.Stream) -> None:
+    """Marks tensors as used on `stream` so the allocator does not reuse them early."""
+    if isinstance(batch, torch.Tensor):
+        batch.record_stream(stream)
+    elif isinstance(batch, (list, tuple)):
+        for b in batch:
+            _record_stream(b, stream)
+    elif isinstance(batch, dict):
+        for b in batch.values():
+            _record_stream(b, stream)
+
+
+class DevicePrefetcher:
+    """Wraps a loader and keeps the next batch's copy to `device` in flight.
+
+    On CUDA the copy of batch `i + 1` is issued from pinned memory on a side
+    stream while batch `i` is being computed, and the compute stream only
+    waits on that copy when the batch is consumed. On other devices batches
+    are moved synchronously, since there is no copy engine to overlap with.
+    """
+
+    def __init__(self, loader: Iterable, device: torch.device | str):
+        self.loader = loader
+        self.device = torch.device(device)
+        self._stream = (
+            torch.cuda.Stream(device=self.device) if self.device.type == "cuda" else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def __iter__(self) -> Iterator:
+        if self._stream is None:
+            for batch in self.loader:
+                yield _to_device(batch, self.device, pin=False)
+            return
+
+        batches = iter(self.loader)
+        next_batch = self._prefetch(batches)
+        while next_batch is not None:
+            batch = next_batch
+            torch.cuda.current_stream(self.device).wait_stream(self._stream)
+            _record_stream(batch, torch.cuda.current_stream(self.device))
+            next_batch = self._prefetch(batches)
+            yield batch
+
+    def _prefetch(self, batches: Iterator) -> Any:
+        """Issues the copy of the next batch on the side stream, or None at the end."""
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return None
+        with torch.cuda.stream(self._stream):
+            return _to_device(batch, self.device, pin=True)
@@ -0,0 +1,428 @@
+"""Streaming, multi-process preprocessing of local text corpora into token shards.
+
+The pipeline reads files lazily and splits them into documents, which are
+handed to worker processes in batches. Workers normalize each document,
+apply the length filter, compute its exact-match key and MinHash LSH band
+keys, and tokenize it. The main process drops exact and near duplicates in
+the order the documents were read, so the output does not depend on the
+number of workers, and appends the survivors to token shards.
+
+Memory is bounded: files are read in chunks and a document is buffered only
+up to `max_chars`, at most two batches per worker are in flight, shards are
+flushed once they hold `shard_tokens` tokens, and both duplicate tables are
+Bloom filters of a fixed size. The price is a small, configurable rate of
+unique documents dropped as false positives, and near duplicates are LSH
+candidates that are not verified against the original signature.
+"""
+
+import collections
+import concurrent.futures
+import glob
+import hashlib
+import io
+import json
+import logging
+import math
+import multiprocessing
+import os
+import pickle
+import re
+import time
+import unicodedata
+import zlib
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import asdict
+
+import numpy as np
+import torch
+
+from ttlm.config import PreprocessConfig
+from ttlm.tokenizer.base import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+# MinHash permutations are (a * x + b) mod a Mersenne prime over 32-bit
+# shingle hashes, which keeps every product within uint64.
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"\w+")
+_SPACES = re.compile(r"[^\S\n]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def iter_files(inputs: Iterable[str], suffix: str = ".txt") -> Iterator[str]:
+    """The given files, and the files ending in `suffix` under the given directories."""
+    for path in inputs:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(suffix):
+                    yield os.path.join(root, name)
+
+
+def _split(
+    f, separator: str | None, chunk_size: int, max_chars: int | None
+) -> Iterator[str | None]:
+    """Splits an open text file on `separator`, reading `chunk_size` characters
+    at a time; without a separator the whole file is one document.
+
+    Only the current document is buffered, and at most `max_chars` of it:
+    longer documents are skipped up to the next separator and yielded as None.
+    """
+    # Characters at the end of the buffer that may begin a separator split
+    # over two chunks; only they are searched again with the next chunk.
+    keep = len(separator) - 1 if separator else 0
+    parts, size, carry = [], 0, ""
+
+    def document(last: str) -> str | None:
+        if max_chars is not None and size + len(last) > max_chars:
+            return None
+        return "".join(parts) + last
+
+    while chunk := f.read(chunk_size):
+        text = carry + chunk
+        *ends, last = text.split(separator) if separator else [text]
+        for end in ends:
+            yield document(end)
+            parts, size = [], 0
+        cut = max(0, len(last) - keep)
+        carry = last[cut:]
+        size += cut
+        if max_chars is None or size <= max_chars:
+            parts.append(last[:cut])
+        else:
+            parts = []
+    yield document(carry)
+
+
+def iter_documents(
+    paths: Iterable[str],
+    separator: str | None,
+    max_chars: int | None = None,
+    chunk_size: int = 1 << 20,
+) -> Iterator[str | None]:
+    """Yields the non-blank documents of `paths`, one file at a time, and None
+    for each document longer than `max_chars`."""
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for document in _split(f, separator, chunk_size, max_chars):
+                if document is None or (document and not document.isspace()):
+                    yield document
+
+
+def normalize(text: str) -> str:
+    """NFKC-normalizes `text`, collapses runs of spaces and blank lines, strips it."""
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _SPACES.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def _key(data: bytes) -> np.ndarray:
+    """A 128-bit hash of `data` as two uint64s."""
+    return np.frombuffer(hashlib.blake2b(data, digest_size=16).digest(), dtype=np.uint64)
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, and their LSH band keys."""
+
+    def __init__(self, num_perm: int, num_bands: int, shingle_size: int, seed: int = 0):
+        if num_perm % num_bands:
+            raise ValueError(f"num_perm {num_perm} is not divisible by num_bands {num_bands}")
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self.num_bands = num_bands
+        self.shingle_size = shingle_size
+
+    def signature(self, text: str) -> np.ndarray | None:
+        """The `num_perm` minimum permuted hashes over the document's shingles,
+        or None if it has no words to shingle."""
+        words = _WORD.findall(text.lower())
+        if not words:
+            return None
+        n = self.shingle_size
+        shingles = {
+            " ".join(words[i : i + n]) for i in range(max(1, len(words) - n + 1))
+        }
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        signature = np.full(self.a.shape[0], _PRIME, dtype=np.uint64)
+        # Chunked, so long documents do not materialize a num_perm x shingles matrix.
+        for start in range(0, len(hashes), 4096):
+            permuted = (self.a * hashes[None, start : start + 4096] + self.b) % _PRIME
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+        return signature
+
+    def band_keys(self, signature: np.ndarray) -> np.ndarray:
+        """A 128-bit key per band, `[num_bands, 2]` uint64."""
+        bands = signature.astype(np.uint32).reshape(self.num_bands, -1)
+        return np.stack(
+            [_key(i.to_bytes(4, "little") + band.tobytes()) for i, band in enumerate(bands)]
+        )
+
+
+class BloomFilter:
+    """A fixed-size set of 128-bit keys with false positives but no false negatives.
+
+    Sized for `capacity` keys at `error_rate`; past that it keeps working but
+    its false positive rate grows.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def _positions(self, keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Byte index and bit mask of each key's `num_hashes` bits (double hashing)."""
+        i = np.arange(self.num_hashes, dtype=np.uint64)
+        bits = (keys[:, :1] + i * keys[:, 1:]) % np.uint64(self.num_bits)
+        return bits >> np.uint64(3), (1 << (bits & np.uint64(7))).astype(np.uint8)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Whether each of the `[n, 2]` keys (probably) was added before."""
+        index, mask = self._positions(keys)
+        return (self.bits[index] & mask).all(axis=1)
+
+    def add(self, keys: np.ndarray) -> None:
+        index, mask = self._positions(keys)
+        np.bitwise_or.at(self.bits, index.ravel(), mask.ravel())
+        self.count += len(keys)
+        if self.count > self.capacity and self.count - len(keys) <= self.capacity:
+            logger.warning(
+                f"Bloom filter is past its capacity of {self.capacity} keys; "
+                "raise expected_documents to keep the false positive rate"
+            )
+
+
+# Per-process state of the workers, set once by `_init_worker`.
+_worker: dict = {}
+
+
+def _init_worker(config: PreprocessConfig, tokenizer: Tokenizer) -> None:
+    _worker["config"] = config
+    _worker["tokenizer"] = tokenizer
+    _worker["minhasher"] = MinHasher(
+        config.num_perm, config.num_bands, config.shingle_size, config.seed
+    )
+
+
+def _process_batch(documents: list[str | None]) -> tuple[list[tuple], dict[str, int]]:
+    """Normalizes, filters, hashes and tokenizes one batch in a worker.
+
+    Returns `(tokens, exact_key, band_keys)` per kept document and the counts
+    of documents dropped by the length filter, to which the None entries of
+    over-long documents are added. `band_keys` is None for
+    documents without words, which are only deduplicated exactly.
+    """
+    config = _worker["config"]
+    tokenizer = _worker["tokenizer"]
+    minhasher = _worker["minhasher"]
+    kept, dropped = [], {"too_short": 0, "too_long": 0}
+    for document in documents:
+        if document is None:
+            dropped["too_long"] += 1
+            continue
+        text = normalize(document)
+        if len(text) < config.min_chars:
+            dropped["too_short"] += 1
+        elif config.max_chars is not None and len(text) > config.max_chars:
+            dropped["too_long"] += 1
+        else:
+            band_keys = None
+            if config.near_dedup:
+                signature = minhasher.signature(text)
+                if signature is not None:
+                    band_keys = minhasher.band_keys(signature)
+            tokens = tokenizer.encode([text])[0].numpy().astype(np.int32)
+            kept.append((tokens, _key(text.encode("utf-8"))[None], band_keys))
+    return kept, dropped
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _map_bounded(
+    fn: Callable, batches: Iterable, num_workers: int, initargs: tuple
+) -> Iterator:
+    """`map(fn, batches)` on `num_workers` spawned processes, in order.
+
+    Unlike `Pool.imap`, which reads its whole input ahead, at most two
+    batches per worker are submitted but not yet consumed.
+    """
+    if num_workers == 0:
+        _init_worker(*initargs)
+        yield from map(fn, batches)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+        num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=initargs,
+    ) as pool:
+        pending = collections.deque()
+        for batch in batches:
+            pending.append(pool.submit(fn, batch))
+            if len(pending) >= 2 * num_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ShardWriter:
+    """Appends documents' tokens to `tokens-NNNNN.pt` shards of bounded size.
+
+    Each shard holds one flat `tokens` tensor and the `documents + 1` document
+    `offsets` into it, like the byte and offsets tensors of `TinyStories`.
+    Shards left in `output_dir` by an earlier run are removed.
+    """
+
+    def __init__(self, output_dir: str, shard_tokens: int, vocab_size: int):
+        self.output_dir = output_dir
+        self.shard_tokens = shard_tokens
+        self.dtype = torch.uint16 if vocab_size <= 2**16 else torch.int32
+        self.shards: list[dict] = []
+        self._pending: list[np.ndarray] = []
+        self._pending_tokens = 0
+        os.makedirs(output_dir, exist_ok=True)
+        stale = glob.glob(os.path.join(output_dir, "tokens-*.pt*"))
+        if stale:
+            logger.info(f"Removing {len(stale)} stale shards from {output_dir}")
+        for path in stale:
+            os.remove(path)
+
+    def add(self, tokens: np.ndarray) -> None:
+        self._pending.append(tokens)
+        self._pending_tokens += len(tokens)
+        if self._pending_tokens >= self.shard_tokens:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        lengths = torch.tensor([len(t) for t in self._pending], dtype=torch.long)
+        offsets = torch.zeros(len(lengths) + 1, dtype=torch.long)
+        torch.cumsum(lengths, dim=0, out=offsets[1:])
+        tokens = torch.from_numpy(np.concatenate(self._pending)).to(self.dtype)
+        name = f"tokens-{len(self.shards):05d}.pt"
+        path = os.path.join(self.output_dir, name)
+        # Serialized in memory: torch.save names the zip records after the
+        # file, so saving to a pid-named temporary would change the bytes.
+        buffer = io.BytesIO()
+        torch.save({"tokens": tokens, "offsets": offsets}, buffer)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(tmp_path, path)
+        self.shards.append(
+            {"path": name, "documents": len(lengths), "tokens": tokens.numel()}
+        )
+        self._pending, self._pending_tokens = [], 0
+
+
+def load_shard(path: str) -> tuple[torch.Tensor, torch.Tensor]:
+    """The memory-mapped `tokens` and `offsets` of a shard written by `ShardWriter`."""
+    shard = torch.load(path, mmap=True)
+    return shard["tokens"], shard["offsets"]
+
+
+def preprocess(
+    paths: Iterable[str],
+    output_dir: str,
+    tokenizer: Tokenizer,
+    config: PreprocessConfig,
+    log_every: int = 100_000,
+) -> dict:
+    """Runs the pipeline over `paths` and writes shards, the pickled tokenizer
+    and `manifest.json`, which `TokenizedCorpus` reads back for training.
+
+    Returns the manifest, whose `stats` count the documents read, dropped by
+    each filter and kept, and the tokens written.
+    """
+    num_workers = config.num_workers
+    if num_workers is None:
+        num_workers = len(os.sched_getaffinity(0))
+    exact = BloomFilter(config.expected_documents, config.false_positive_rate)
+    # A document is a near duplicate if any of its bands was seen, so each band
+    # key gets a share of the false positive budget.
+    near = BloomFilter(
+        config.expected_documents * config.num_bands,
+        config.false_positive_rate / config.num_bands,
+    )
+    logger.info(
+        f"Dedup tables: {(exact.nbytes + near.nbytes) / 2**20:.0f} MiB, "
+        f"{num_workers} workers"
+    )
+    writer = ShardWriter(output_dir, config.shard_tokens, tokenizer.vocab_size)
+    stats = collections.Counter()
+    start, next_log = time.perf_counter(), log_every
+
+    documents = iter_documents(paths, config.separator, config.max_chars)
+    batches = _batched(documents, config.batch_size)
+    for kept, dropped in _map_bounded(
+        _process_batch, batches, num_workers, (config, tokenizer)
+    ):
+        stats.update(dropped)
+        stats["documents"] += len(kept) + sum(dropped.values())
+        for tokens, exact_key, band_keys in kept:
+            if config.exact_dedup:
+                if exact.contains(exact_key)[0]:
+                    stats["exact_duplicates"] += 1
+                    continue
+                exact.add(exact_key)
+            if band_keys is not None:
+                if near.contains(band_keys).any():
+                    stats["near_duplicates"] += 1
+                    continue
+                near.add(band_keys)
+            writer.add(tokens)
+            stats["kept"] += 1
+            stats["tokens"] += len(tokens)
+        if stats["documents"] >= next_log:
+            next_log += log_every
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"{stats['documents']} documents, {stats['kept']} kept, "
+                f"{stats['documents'] / elapsed:.0f} documents/s"
+            )
+    writer.flush()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = round(elapsed, 3)
+    # Training must use the tokenizer the shards were encoded with.
+    with open(os.path.join(output_dir, "tokenizer.pkl"), "wb") as f:
+        pickle.dump(tokenizer, f)
+    manifest = {
+        "config": asdict(config),
+        "tokenizer": f"{type(tokenizer).__module__}.{type(tokenizer).__qualname__}",
+        "tokenizer_file": "tokenizer.pkl",
+        "vocab_size": tokenizer.vocab_size,
+        "bos_token_id": tokenizer.bos_token_id,
+        "eos_token_id": tokenizer.eos_token_id,
+        "pad_token_id": tokenizer.pad_token_id,
+        "stats": dict(stats),
+        "shards": writer.shards,
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
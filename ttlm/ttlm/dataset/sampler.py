@@ -0,0 +1,67 @@
+"""Distributed sampler that can resume mid-epoch under a different world size."""
+
+from collections.abc import Iterator
+
+import torch
+from torch.utils.data import Sampler
+
+
+class ResumableSampler(Sampler[int]):
+    """Shards each epoch's global batches across ranks, starting at any sample.
+
+    Every epoch is one seeded permutation of the dataset, cut into global
+    batches of `global_batch_size` samples (a trailing partial batch is
+    dropped). Rank `r` of `num_replicas` takes every `num_replicas`-th sample
+    starting at `r`, so with a per-rank batch of `global_batch_size //
+    num_replicas` the ranks' batches for step `s` together form exactly the
+    `s`-th global batch. The order of training therefore does not depend on
+    the world size, and `set_epoch(epoch, start)` resumes after `start`
+    samples of that epoch with any number of ranks.
+    """
+
+    def __init__(
+        self,
+        num_samples: int,
+        global_batch_size: int,
+        num_replicas: int = 1,
+        rank: int = 0,
+        shuffle: bool = True,
+        seed: int = 0,
+    ):
+        if global_batch_size % num_replicas:
+            raise ValueError(
+                f"Global batch size {global_batch_size} is not divisible by "
+                f"world size {num_replicas}"
+            )
+        self.num_samples = num_samples
+        self.global_batch_size = global_batch_size
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.start = 0
+
+    @property
+    def samples_per_epoch(self) -> int:
+        """Samples in the full global batches of one epoch."""
+        return self.num_samples // self.global_batch_size * self.global_batch_size
+
+    def set_epoch(self, epoch: int, start: int = 0) -> None:
+        """Selects the epoch's permutation and skips its first `start` samples."""
+        if start % self.global_batch_size:
+            raise ValueError(f"Start {start} is not a whole number of global batches")
+        self.epoch = epoch
+        self.start = start
+
+    def __iter__(self) -> Iterator[int]:
+        if self.shuffle:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            indices = torch.randperm(self.num_samples, generator=generator)
+        else:
+            indices = torch.arange(self.num_samples)
+        indices = indices[self.start + self.rank : self.samples_per_epoch : self.num_replicas]
+        return iter(indices.tolist())
+
+    def __len__(self) -> int:
+        return max(0, self.samples_per_epoch - self.start) // self.num_replicas
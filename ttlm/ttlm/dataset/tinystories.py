@@ -1,37 +1,122 @@
 """PyTorch Dataset for sampling from a Parquet file."""
+import functools
+import hashlib
+import os
+import zlib
+from typing import Literal
+
 import requests
+import torch
 from torch.utils.data import Dataset
 
+TINYSTORIES_URL = "https://www.cs.toronto.edu/~cmaddis/files/TinyStories-train-subset.txt"
+
+
+@functools.cache
+def _download(url: str, cache_dir: str | None = None) -> str:
+    """Downloads the text once per process, so several splits share one request.
+
+    With `cache_dir`, the text is also kept on disk and shared between runs.
+    """
+    path = None
+    if cache_dir is not None:
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(cache_dir, f"corpus-{digest}.txt")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+    response = requests.get(url)
+    response.raise_for_status()
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        os.replace(tmp_path, path)
+    return response.text
+
+
+def is_held_out(story: str, val_fraction: float, seed: int = 0) -> bool:
+    """Deterministically assigns a story to the held-out split by hashing its text.
+
+    The assignment depends only on the story and the seed, not on its position,
+    so it is stable across processes, ranks and reorderings of the source file.
+    """
+    bucket = zlib.crc32(story.encode("utf-8"), seed) / 2**32
+    return bucket < val_fraction
+
+
 class TinyStories(Dataset):
     """
     Tiny stories dataset (subset).
+
+    Stories are stored as one UTF-8 byte tensor plus an offsets tensor rather
+    than a list of Python strings. Both live in shared memory, so DataLoader
+    workers neither receive a pickled copy of the corpus nor trigger
+    copy-on-write faults by touching per-string reference counts.
     """
     def __init__(
         self,
-        url: str = "https://www.cs.toronto.edu/~cmaddis/files/TinyStories-train-subset.txt"
+        url: str = TINYSTORIES_URL,
+        split: Literal["train", "val"] = "train",
+        val_fraction: float = 0.0,
+        seed: int = 0,
+        cache_dir: str | None = None,
     ) -> None:
         """Initializes the dataset by storing metadata but defers reading data."""
         super().__init__()
         self.url = url
-        self.data = self._init_data()
+        self.split = split
+        self.val_fraction = val_fraction
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self._text, self._offsets = self._pack(self._init_data(url))
+
+    @staticmethod
+    def _pack(stories: list[str]) -> tuple[torch.Tensor, torch.Tensor]:
+        """Concatenated UTF-8 bytes of `stories` and the `len + 1` story boundaries."""
+        encoded = [story.encode("utf-8") for story in stories]
+        offsets = torch.zeros(len(encoded) + 1, dtype=torch.long)
+        torch.cumsum(
+            torch.tensor([len(b) for b in encoded], dtype=torch.long),
+            dim=0,
+            out=offsets[1:],
+        )
+        joined = b"".join(encoded)
+        # frombuffer rejects an empty buffer, e.g. a split with no stories.
+        text = (
+            torch.frombuffer(bytearray(joined), dtype=torch.uint8)
+            if joined
+            else torch.empty(0, dtype=torch.uint8)
+        )
+        return text.share_memory_(), offsets.share_memory_()
+
+    @property
+    def data(self) -> list[str]:
+        """All stories of the split as a list of strings."""
+        return [self[i] for i in range(len(self))]
 
-    def _init_data(self, url: str = "https://www.cs.toronto.edu/~cmaddis/files/TinyStories-train-subset.txt") -> list[str]:
+    def _init_data(self, url: str = TINYSTORIES_URL) -> list[str]:
         """Downloads the TinyStories text file and splits it into individual stories to create the dataset."""
-        response = requests.get(url)
-        response.raise_for_status()
-        text = response.text
+        text = _download(url, self.cache_dir)
         stories = [story.strip() for story in text.split('<|endoftext|>') if story.strip()]
-        return stories
+        held_out = self.split == "val"
+        return [
+            story
+            for story in stories
+            if is_held_out(story, self.val_fraction, self.seed) == held_out
+        ]
 
     def __len__(self) -> int:
         """Returns the number of rows that satisfy the filter condition."""
-        return len(self.data)
+        return self._offsets.numel() - 1
 
     def __getitem__(self, idx: int) -> str:
         """
         Retrieves the 'text' sample for the idx-th valid row.
         Initializes the data connection on the first call within each worker.
         """
-        if not (0 <= idx < len(self.data)):
+        if not (0 <= idx < len(self)):
             raise IndexError("Index out of range for the dataset")
-        return self.data[idx]
+        start, end = self._offsets[idx].item(), self._offsets[idx + 1].item()
+        return self._text[start:end].numpy().tobytes().decode("utf-8")
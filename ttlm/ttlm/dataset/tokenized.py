@@ -0,0 +1,78 @@
+"""PyTorch Dataset over the token shards written by `ttlm.dataset.preprocess`."""
+
+import json
+import os
+import pickle
+from typing import Literal
+
+import torch
+from torch.utils.data import Dataset
+
+from ttlm.dataset.preprocess import load_shard
+from ttlm.tokenizer.base import Tokenizer
+
+
+class TokenizedCorpus(Dataset):
+    """
+    Documents of a preprocessed corpus, as token ids.
+
+    Reads `manifest.json` in `path` and memory-maps its `tokens-NNNNN.pt`
+    shards, so opening a corpus reads no tokens and DataLoader workers share
+    the page cache. Each item is one document's `LongTensor` of token ids, as
+    the tokenizer returns it, so it can stand in for `TinyStories` wherever
+    documents are collated or packed. The held-out split is a seeded random
+    `val_fraction` of the documents, fixed for a given corpus and seed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        split: Literal["train", "val"] = "train",
+        val_fraction: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.split = split
+        self.val_fraction = val_fraction
+        self.seed = seed
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self._shards = [
+            load_shard(os.path.join(path, shard["path"]))
+            for shard in self.manifest["shards"]
+        ]
+        counts = torch.tensor(
+            [shard["documents"] for shard in self.manifest["shards"]], dtype=torch.long
+        )
+        self._shard_starts = torch.zeros(len(counts) + 1, dtype=torch.long)
+        torch.cumsum(counts, dim=0, out=self._shard_starts[1:])
+
+        generator = torch.Generator().manual_seed(seed)
+        held_out = torch.rand(int(self._shard_starts[-1]), generator=generator) < val_fraction
+        self._documents = torch.nonzero(held_out == (split == "val")).flatten()
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        """The tokenizer the corpus was encoded with."""
+        with open(os.path.join(self.path, self.manifest["tokenizer_file"]), "rb") as f:
+            return pickle.load(f)
+
+    @property
+    def data(self) -> list[torch.Tensor]:
+        """All documents of the split as a list of token tensors."""
+        return [self[i] for i in range(len(self))]
+
+    def __len__(self) -> int:
+        """Returns the number of documents in the split."""
+        return self._documents.numel()
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        """Returns the token ids of the idx-th document of the split."""
+        if not (0 <= idx < len(self)):
+            raise IndexError("Index out of range for the dataset")
+        document = self._documents[idx]
+        shard = int(torch.searchsorted(self._shard_starts, document, right=True)) - 1
+        tokens, offsets = self._shards[shard]
+        i = int(document - self._shard_starts[shard])
+        return tokens[offsets[i] : offsets[i + 1]].long()
@@ -1,6 +1,7 @@
 """Distributed training utilities for PyTorch."""
 """ Original author: Liam Atkinson """
 
+import logging
 import os
 from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
@@ -11,6 +12,10 @@ from typing import ClassVar, Literal
 import torch
 import torch.distributed as dist
 
+from ttlm.cpu import split_cores
+
+logger = logging.getLogger(__name__)
+
 
 @dataclass(slots=True)
 class World(AbstractContextManager):
@@ -19,6 +24,11 @@ class World(AbstractContextManager):
     device: torch.device | str = "cpu"
     backend: Literal["nccl", "gloo", "mpi"] | None = None
     timeout_sec: int = 1800
+    # CPU ranks: intra-op and inter-op thread counts (None keeps PyTorch's
+    # default) and whether to pin each local rank to its own slice of cores.
+    num_threads: int | None = None
+    num_interop_threads: int | None = None
+    pin_cores: bool = False
 
     _ENV_KEYS: ClassVar[tuple[str, ...]] = (
         "RANK",
@@ -31,6 +41,8 @@ class World(AbstractContextManager):
     rank: int = field(init=False, default=0)
     world_size: int = field(init=False, default=1)
     local_rank: int = field(init=False, default=0)
+    cores: list[int] | None = field(init=False, default=None)
+    restart_count: int = field(init=False, default=0)
 
     @property
     def distributed(self) -> bool:
@@ -56,11 +68,14 @@ class World(AbstractContextManager):
             dist.init_process_group(
                 backend=self.backend or self._auto_backend,
                 timeout=self.timeout,
+                **self._elastic_store_kwargs(),
             )
 
         self.rank = dist.get_rank() if dist.is_initialized() else 0
         self.world_size = dist.get_world_size() if dist.is_initialized() else 1
         self.local_rank = int(os.getenv("LOCAL_RANK", self.rank))
+        # Set by torchrun's elastic agent each time it restarts the workers.
+        self.restart_count = int(os.getenv("TORCHELASTIC_RESTART_COUNT", "0"))
 
         if self.device.type == "cuda":
             if self.local_rank >= torch.cuda.device_count():
@@ -70,9 +85,35 @@ class World(AbstractContextManager):
                 )
             torch.cuda.set_device(self.local_rank)
             self.device = torch.device(f"cuda:{self.local_rank}")
+        elif self.device.type == "cpu":
+            self._configure_cpu()
 
         return self
 
+    def _configure_cpu(self) -> None:
+        """Pins this rank to its share of the node's cores and sizes its thread pools.
+
+        Cores are split between the local ranks NUMA node by node, so a rank
+        only spans nodes when its slice cannot fit in one.
+        """
+        if self.pin_cores:
+            local_world_size = int(os.getenv("LOCAL_WORLD_SIZE", "1"))
+            self.cores = split_cores(local_world_size, self.num_threads)[self.local_rank]
+            os.sched_setaffinity(0, self.cores)
+        num_threads = self.num_threads or (len(self.cores) if self.cores else None)
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        if self.num_interop_threads is not None:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError:
+                # Only settable before the first inter-op parallel work.
+                logger.warning(
+                    f"Could not set {self.num_interop_threads} inter-op threads, "
+                    "inter-op work already started; keeping "
+                    f"{torch.get_num_interop_threads()}"
+                )
+
     def barrier(self) -> None:
         """Synchronise all processes. No-op in single-process runs."""
         if self.distributed:
@@ -88,6 +129,30 @@ class World(AbstractContextManager):
         if dist.is_initialized():
             dist.destroy_process_group()
 
+    def _elastic_store_kwargs(self) -> dict:
+        """Store arguments that isolate each restart of an elastic worker group.
+
+        torchrun's agent hosts one TCPStore for the whole job, so after a
+        restart the new ranks would otherwise read the dead ranks' addresses
+        left over from the previous round and fail to connect.
+        """
+        if "TORCHELASTIC_RESTART_COUNT" not in os.environ:
+            return {}
+        rank, world_size = int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"])
+        store = dist.TCPStore(
+            os.environ["MASTER_ADDR"],
+            int(os.environ["MASTER_PORT"]),
+            world_size,
+            is_master=rank == 0 and os.getenv("TORCHELASTIC_USE_AGENT_STORE") != "True",
+            timeout=self.timeout,
+        )
+        prefix = f"restart_{os.environ['TORCHELASTIC_RESTART_COUNT']}"
+        return {
+            "store": dist.PrefixStore(prefix, store),
+            "rank": rank,
+            "world_size": world_size,
+        }
+
     @staticmethod
     def _should_init_pg() -> bool:
         """Return True only when the standard env vars are set *and* WORLD_SIZE>1."""
@@ -1,35 +1,125 @@
+from collections.abc import Iterator, Sequence
+
 import torch
 from torch import nn
 from torch import Tensor
-import torch.nn.functional as F
+from torch.profiler import record_function
+from ttlm.kv_cache import KVCache
+from ttlm.prefix_cache import PrefixCache
+from ttlm.sampling import SamplingParams, make_generators, sample
 from ttlm.tokenizer.base import Tokenizer
 
 @torch.inference_mode()
-def generate(
+def stream(
         model,
         input_ids: Tensor,
         max_new_tokens: int = 100,
-        temperature: float = 1.0,
-        top_k: int | None = None,
-    ) -> Tensor:
-        """Naive autoregressive generation."""
+        temperature: float | Sequence[float] = 1.0,
+        top_k: int | Sequence[int] | None = None,
+        top_p: float | Sequence[float] = 1.0,
+        min_p: float | Sequence[float] = 0.0,
+        repetition_penalty: float | Sequence[float] = 1.0,
+        seed: int | Sequence[int] | None = None,
+        profiler=None,
+        use_cache: bool = True,
+        prefix_cache: PrefixCache | None = None,
+        stop_token_id: int | None = None,
+    ) -> Iterator[Tensor]:
+        """Autoregressive generation with a KV cache, yielding tokens as sampled.
+
+        Each step yields the `[batch]` tensor of newly sampled token ids, so
+        callers can print or forward text before the whole output exists. With
+        `stop_token_id`, the stream ends once every row has produced it; rows
+        that stopped earlier yield `stop_token_id` until then.
+
+        The prompt is processed once (``prefill``) and each following step
+        feeds only the newest token (``decode``). Sliding-window layers keep a
+        ring buffer, so their cost per token does not grow with the output.
+        Pass a profiler from `ttlm.profiler.build_profiler` to have it stepped
+        once per generated token. With a `prefix_cache`, a single prompt reuses
+        the KV state of its longest cached prefix and only the rest is
+        prefilled; the prompt is then added to the prefix cache.
+
+        Sampling parameters are scalars or one value per row, see
+        `ttlm.sampling.sample`; a temperature of 0 decodes greedily. With
+        `seed`, every row gets its own seeded generator.
+        """
         model.eval()
-        for _ in range(max_new_tokens):
+        batch_size = input_ids.size(0)
+        params = SamplingParams.create(
+            batch_size,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+            min_p=min_p,
+            repetition_penalty=repetition_penalty,
+            device=input_ids.device,
+        )
+        generators = (
+            None if seed is None else make_generators(seed, batch_size, input_ids.device)
+        )
+        penalize = torch.any(params.repetition_penalty != 1.0).item()
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=input_ids.device)
+        cache = KVCache.for_model(model) if use_cache else None
+        prefix_len = 0
+        if prefix_cache is not None:
+            if input_ids.size(0) != 1:
+                raise ValueError("Prefix caching serves one prompt at a time")
+            cache, prefix_len = prefix_cache.lookup(model, input_ids[0].tolist())
+        prompt_len = input_ids.size(1)
+        output_ids = input_ids.new_empty(input_ids.size(0), prompt_len + max_new_tokens)
+        output_ids[:, :prompt_len] = input_ids
+        for step in range(max_new_tokens):
+            end = prompt_len + step
             with torch.no_grad():
-                logits = model(input_ids)
-                next_token_logits = logits[:, -1, :] / temperature
-
-                if top_k is not None:
-                    top_k = min(top_k, logits.size(-1))
-                    indices_to_remove = (
-                        next_token_logits
-                        < torch.topk(next_token_logits, top_k)[0][..., -1, None]
+                with record_function("prefill" if step == 0 else "decode"):
+                    if cache is None:
+                        logits = model(output_ids[:, :end])
+                    else:
+                        start = prefix_len if step == 0 else end - 1
+                        logits = model(output_ids[:, start:end], cache=cache)
+                        if step == 0 and prefix_cache is not None:
+                            prefix_cache.insert(input_ids[0].tolist(), cache)
+                with record_function("sample"):
+                    next_token = sample(
+                        logits[:, -1, :],
+                        params,
+                        generators=generators,
+                        prev_tokens=output_ids[:, :end] if penalize else None,
                     )
-                    next_token_logits[indices_to_remove] = float("-inf")
+                if stop_token_id is not None:
+                    # Rows that already stopped keep emitting the stop token.
+                    next_token = next_token.masked_fill(finished, stop_token_id)
+
+                output_ids[:, end] = next_token
+            if profiler is not None:
+                profiler.step()
+            yield next_token
+            if stop_token_id is not None:
+                finished |= next_token == stop_token_id
+                if finished.all():
+                    return
 
-                probs = F.softmax(next_token_logits, dim=-1)
-                next_token = torch.multinomial(probs, num_samples=1)
 
-                input_ids = torch.cat([input_ids, next_token], dim=1)
+@torch.inference_mode()
+def generate(
+        model,
+        input_ids: Tensor,
+        max_new_tokens: int = 100,
+        **kwargs,
+    ) -> Tensor:
+        """Autoregressive generation with a KV cache, see `stream` for arguments.
 
-        return input_ids
+        Returns the prompt followed by the generated tokens: `max_new_tokens`
+        of them, or fewer with `stop_token_id` once every row has stopped.
+        Rows that stop earlier are filled with `stop_token_id` after it.
+        """
+        prompt_len = input_ids.size(1)
+        output_ids = input_ids.new_empty(input_ids.size(0), prompt_len + max_new_tokens)
+        output_ids[:, :prompt_len] = input_ids
+        num_steps = 0
+        for num_steps, next_token in enumerate(
+            stream(model, input_ids, max_new_tokens=max_new_tokens, **kwargs), start=1
+        ):
+            output_ids[:, prompt_len + num_steps - 1] = next_token
+        return output_ids[:, : prompt_len + num_steps]
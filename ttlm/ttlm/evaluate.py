@@ -0,0 +1,89 @@
+"""Held-out evaluation for the pre-training loop."""
+
+import math
+from collections.abc import Sequence
+
+import torch
+import torch.distributed as dist
+import torch.nn.functional as F
+from torch import Tensor, nn
+
+from ttlm.dataset.packing import pack
+from ttlm.tokenizer.base import Tokenizer
+
+
+def build_eval_batches(
+    texts: Sequence[str] | Sequence[Tensor],
+    tokenizer: Tokenizer,
+    seq_len: int,
+    batch_size: int,
+    max_tokens: int | None = None,
+    rank: int = 0,
+    world_size: int = 1,
+) -> list[Tensor]:
+    """Tokenizes and packs this rank's shard of the held-out texts into batches.
+
+    Documents are strided across ranks, and each rank stops tokenizing once it
+    holds its share of `max_tokens`, so the one-off cost of building the eval
+    set is bounded by the same budget as the evaluation itself. Texts that
+    are already token tensors are used as they are.
+    """
+    budget = None if max_tokens is None else max(1, max_tokens // world_size)
+    sequences, num_tokens = [], 0
+    for text in texts[rank::world_size]:
+        if budget is not None and num_tokens >= budget:
+            break
+        (ids,) = [text] if isinstance(text, Tensor) else tokenizer.encode([text])
+        sequences.append(ids)
+        num_tokens += ids.numel()
+    if not sequences:
+        return []
+
+    rows = pack(sequences, seq_len=seq_len, pad_token_id=tokenizer.pad_token_id)
+    if budget is not None:
+        rows = rows[: -(-budget // seq_len)]
+    return list(rows.split(batch_size))
+
+
+@torch.inference_mode()
+def evaluate(
+    model: nn.Module,
+    batches: Sequence[Tensor],
+    pad_token_id: int,
+    device: torch.device,
+    dtype: torch.dtype = torch.float32,
+) -> dict[str, float]:
+    """Computes token-weighted loss and perplexity over `batches`.
+
+    Loss and token counts are accumulated on device and combined across ranks
+    with a single all-reduce at the end, so no step in the loop synchronises.
+    """
+    was_training = model.training
+    model.eval()
+    stats = torch.zeros(2, device=device, dtype=torch.float64)
+    for input_ids in batches:
+        input_ids = input_ids.to(device, non_blocking=True)
+        with torch.autocast(
+            device_type=device.type, dtype=dtype, enabled=dtype != torch.float32
+        ):
+            logits = model(input_ids)
+        labels = input_ids[:, 1:]
+        loss = F.cross_entropy(
+            logits[:, :-1].reshape(-1, logits.size(-1)).float(),
+            labels.reshape(-1),
+            ignore_index=pad_token_id,
+            reduction="sum",
+        )
+        stats[0] += loss
+        stats[1] += (labels != pad_token_id).sum()
+    if dist.is_initialized() and dist.get_world_size() > 1:
+        dist.all_reduce(stats)
+    model.train(was_training)
+
+    loss_sum, num_tokens = stats.tolist()
+    val_loss = loss_sum / max(num_tokens, 1)
+    return {
+        "val_loss": val_loss,
+        "val_ppl": math.exp(min(val_loss, 50.0)),
+        "val_tokens": int(num_tokens),
+    }
@@ -0,0 +1,212 @@
+"""Export a model as standalone prefill and decode programs for serving.
+
+The exported artifact is a directory with two `torch.export` programs and a
+JSON file describing the model and tokenizer:
+
+- ``prefill.pt2``: ``input_ids [batch, seq]`` to the logits of the last
+  position ``[batch, vocab]`` and the KV cache ``keys``/``values``, each
+  ``[num_layers, batch, num_kv_heads, seq, head_dim]``.
+- ``decode.pt2``: ``input_ids [batch, 1]`` and a KV cache of ``past`` positions
+  to the next logits and the cache extended to ``past + 1`` positions.
+
+Batch, prompt length and cache length are dynamic. The KV cache is passed in
+and returned instead of held in module state, so the programs are pure
+functions and any number of sequences can be decoded with one program.
+
+With the ``aoti`` backend (the default) both programs are compiled ahead of
+time by AOTInductor into packaged shared libraries, which needs a C++
+compiler at export time but not at load time. The ``export`` backend saves
+the traced programs as they are, for hosts without a compiler; they run at
+about eager speed and load slower. Either way running them needs only torch,
+see `scripts/run_exported.py`.
+"""
+
+import json
+import os
+
+import torch
+from torch import Tensor, nn
+from torch.export import Dim
+
+from ttlm.model import Model
+from ttlm.tokenizer.base import Tokenizer
+
+FORMAT_VERSION = 1
+
+
+class _ConcatLayerCache:
+    """Functional `LayerKVCache` stand-in that grows by concatenation."""
+
+    def __init__(self, keys: Tensor, values: Tensor):
+        self.keys = keys
+        self.values = values
+
+    def update(
+        self, k: Tensor, v: Tensor, positions: Tensor
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        self.keys = torch.cat([self.keys, k], dim=2)
+        self.values = torch.cat([self.values, v], dim=2)
+        return self.keys, self.values, torch.arange(self.keys.size(2), device=k.device)
+
+
+class _ConcatCache:
+    """`KVCache` stand-in over stacked ``[layers, batch, heads, seq, dim]`` tensors."""
+
+    def __init__(self, keys: Tensor, values: Tensor):
+        self.layers = [
+            _ConcatLayerCache(k, v) for k, v in zip(keys.unbind(0), values.unbind(0))
+        ]
+        self.seq_len = keys.size(3)
+
+    def __getitem__(self, i: int) -> _ConcatLayerCache:
+        return self.layers[i]
+
+    def stacked(self) -> tuple[Tensor, Tensor]:
+        return (
+            torch.stack([layer.keys for layer in self.layers]),
+            torch.stack([layer.values for layer in self.layers]),
+        )
+
+
+class Prefill(nn.Module):
+    """Runs a prompt, returning the last logits and the KV cache."""
+
+    def __init__(self, model: Model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: Tensor) -> tuple[Tensor, Tensor, Tensor]:
+        model = self.model
+        empty = model.embeddings.weight.new_zeros(
+            model.num_layers,
+            input_ids.size(0),
+            model.num_kv_heads,
+            0,
+            model.hidden_dim // model.num_heads,
+        )
+        cache = _ConcatCache(empty, empty)
+        hidden = model.hidden_states(input_ids, cache=cache)
+        return (model.project(hidden[:, -1]), *cache.stacked())
+
+
+class Decode(nn.Module):
+    """Feeds one token per sequence, returning its logits and the extended cache."""
+
+    def __init__(self, model: Model):
+        super().__init__()
+        self.model = model
+
+    def forward(
+        self, input_ids: Tensor, keys: Tensor, values: Tensor
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        cache = _ConcatCache(keys, values)
+        hidden = self.model.hidden_states(input_ids, cache=cache)
+        return (self.model.project(hidden[:, -1]), *cache.stacked())
+
+
+def check_exportable(model: Model) -> None:
+    """Raises ValueError for layers whose shapes depend on the data."""
+    if any(window is not None for window in model.window_sizes):
+        raise ValueError("Sliding-window layers (ring-buffer KV cache) cannot be exported")
+    if any(experts is not None for experts in model.num_experts):
+        raise ValueError("MoE layers (data-dependent expert capacity) cannot be exported")
+
+
+def export_programs(
+    model: Model, max_seq_len: int = 4096
+) -> dict[str, torch.export.ExportedProgram]:
+    """Traces the prefill and decode programs with dynamic batch and lengths."""
+    check_exportable(model)
+    model = model.eval()
+    device = model.embeddings.weight.device
+    dtype = model.embeddings.weight.dtype
+    head_dim = model.hidden_dim // model.num_heads
+    batch = Dim("batch", min=1, max=1024)
+    seq = Dim("seq", min=1, max=max_seq_len)
+    past = Dim("past", min=1, max=max_seq_len - 1)
+
+    # Contiguous and distinct example tensors: compiled programs assume the
+    # example strides, and export would treat keys and values as aliases.
+    input_ids = torch.zeros(2, 3, dtype=torch.long, device=device)
+    next_ids = torch.zeros(2, 1, dtype=torch.long, device=device)
+    keys, values = (
+        torch.zeros(
+            model.num_layers, 2, model.num_kv_heads, 3, head_dim, device=device, dtype=dtype
+        )
+        for _ in range(2)
+    )
+    with torch.no_grad():
+        prefill = torch.export.export(
+            Prefill(model),
+            (input_ids,),
+            dynamic_shapes={"input_ids": {0: batch, 1: seq}},
+        )
+        decode = torch.export.export(
+            Decode(model),
+            (next_ids, keys, values),
+            dynamic_shapes={
+                "input_ids": {0: batch},
+                "keys": {1: batch, 3: past},
+                "values": {1: batch, 3: past},
+            },
+        )
+    return {"prefill": prefill, "decode": decode}
+
+
+def tokenizer_metadata(tokenizer: Tokenizer) -> dict:
+    """What a loader needs to encode and decode text without the tokenizer class.
+
+    Encoding is greedy longest match over `pieces`, as in `BPETokenizer`.
+    """
+    special = {
+        tokenizer.bos_token_id,
+        tokenizer.eos_token_id,
+        tokenizer.pad_token_id,
+        tokenizer.unk_token_id,
+    }
+    return {
+        "pieces": [
+            "" if i in special else tokenizer.decode_token(i)
+            for i in range(tokenizer.vocab_size)
+        ],
+        "bos_token_id": tokenizer.bos_token_id,
+        "eos_token_id": tokenizer.eos_token_id,
+        "pad_token_id": tokenizer.pad_token_id,
+        "unk_token_id": tokenizer.unk_token_id,
+    }
+
+
+def save_artifact(
+    model: Model,
+    tokenizer: Tokenizer,
+    output_dir: str,
+    max_seq_len: int = 4096,
+    backend: str = "aoti",
+) -> None:
+    """Exports `model` and writes the prefill/decode programs and metadata."""
+    if backend not in ("aoti", "export"):
+        raise ValueError(f"Unknown export backend {backend!r}, expected 'aoti' or 'export'")
+    programs = export_programs(model, max_seq_len=max_seq_len)
+    os.makedirs(output_dir, exist_ok=True)
+    for name, program in programs.items():
+        path = os.path.join(output_dir, f"{name}.pt2")
+        if backend == "aoti":
+            from torch._inductor import aoti_compile_and_package
+
+            aoti_compile_and_package(program, package_path=path)
+        else:
+            torch.export.save(program, path)
+    metadata = {
+        "format_version": FORMAT_VERSION,
+        "backend": backend,
+        "device": str(model.embeddings.weight.device),
+        "vocab_size": model.vocab_size,
+        "num_layers": model.num_layers,
+        "num_kv_heads": model.num_kv_heads,
+        "head_dim": model.hidden_dim // model.num_heads,
+        "max_seq_len": max_seq_len,
+        "dtype": str(model.embeddings.weight.dtype).removeprefix("torch."),
+        "tokenizer": tokenizer_metadata(tokenizer),
+    }
+    with open(os.path.join(output_dir, "metadata.json"), "w") as f:
+        json.dump(metadata, f)
@@ -0,0 +1,106 @@
+"""Key/value caches for incremental decoding."""
+
+import torch
+from torch import Tensor
+
+
+class LayerKVCache:
+    """Keys and values of one attention layer.
+
+    Full-attention layers keep every position in a buffer that doubles in
+    capacity as it fills. Sliding-window layers keep a fixed ring buffer of
+    `window` slots, so their memory and per-token cost stay constant however
+    long the generation runs.
+    """
+
+    def __init__(self, window: int | None = None):
+        self.window = window
+        self.length = 0
+        self.keys: Tensor | None = None
+        self.values: Tensor | None = None
+        self.positions: Tensor | None = None
+
+    def _allocate(self, like: Tensor, capacity: int) -> None:
+        """(Re)allocates the buffers, preserving what has been stored so far."""
+        b, h, _, d = like.shape
+        keys = like.new_zeros(b, h, capacity, d)
+        values = like.new_zeros(b, h, capacity, d)
+        positions = like.new_full((capacity,), -1, dtype=torch.long)
+        if self.keys is not None:
+            keys[:, :, : self.length] = self.keys[:, :, : self.length]
+            values[:, :, : self.length] = self.values[:, :, : self.length]
+            positions[: self.length] = self.positions[: self.length]
+        self.keys, self.values, self.positions = keys, values, positions
+
+    def update(
+        self, k: Tensor, v: Tensor, positions: Tensor
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        """Stores `k`/`v` at absolute `positions`, returns what to attend over.
+
+        Returns keys, values and the absolute position of every returned slot
+        (-1 for ring buffer slots that have not been written yet).
+        """
+        n = k.size(2)
+        if self.window is None:
+            end = self.length + n
+            if self.keys is None or end > self.keys.size(2):
+                self._allocate(k, max(end, 2 * self.length))
+            self.keys[:, :, self.length : end] = k
+            self.values[:, :, self.length : end] = v
+            self.positions[self.length : end] = positions
+            self.length = end
+            return self.keys[:, :, :end], self.values[:, :, :end], self.positions[:end]
+
+        if self.keys is None:
+            self._allocate(k, self.window)
+        self.length = min(self.length + n, self.window)
+        if n == 1:
+            # Decode: overwrite the oldest slot in place and attend to the ring.
+            slots = positions % self.window
+            self.keys.index_copy_(2, slots, k)
+            self.values.index_copy_(2, slots, v)
+            self.positions.index_copy_(0, slots, positions)
+            return self.keys, self.values, self.positions
+
+        # Prefill: earlier queries of the chunk still need keys that fall out of
+        # the ring, so attend over the old ring plus the whole chunk.
+        keys = torch.cat([self.keys, k], dim=2)
+        values = torch.cat([self.values, v], dim=2)
+        key_positions = torch.cat([self.positions, positions])
+        keep = min(n, self.window)
+        slots = positions[-keep:] % self.window
+        self.keys.index_copy_(2, slots, k[:, :, -keep:])
+        self.values.index_copy_(2, slots, v[:, :, -keep:])
+        self.positions.index_copy_(0, slots, positions[-keep:])
+        return keys, values, key_positions
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the key and value buffers."""
+        if self.keys is None:
+            return 0
+        return 2 * self.keys.numel() * self.keys.element_size()
+
+
+class KVCache:
+    """Per-layer key/value caches of a model, advanced in lockstep for the batch."""
+
+    def __init__(self, windows: list[int | None]):
+        self.layers = [LayerKVCache(window) for window in windows]
+        self.seq_len = 0
+
+    @classmethod
+    def for_model(cls, model) -> "KVCache":
+        """An empty cache matching the attention windows of `model`."""
+        return cls(list(model.window_sizes))
+
+    def __getitem__(self, idx: int) -> LayerKVCache:
+        return self.layers[idx]
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by all layers."""
+        return sum(layer.nbytes for layer in self.layers)
@@ -0,0 +1,66 @@
+"""Training metrics accumulated on device and flushed periodically."""
+
+from collections.abc import Iterable
+
+import torch
+import torch.distributed as dist
+from torch import Tensor
+
+
+class MetricsAccumulator:
+    """Running sums of per-step metrics that never synchronise until `flush`.
+
+    `update` adds tensors on device (e.g. the loss or grad norm) and plain
+    numbers on the host (e.g. token counts or the learning rate). `flush`
+    stacks everything into one tensor, combines it across ranks with a single
+    all-reduce, copies it to the host once and resets the sums. Metrics named
+    in `sum_keys` are reported as totals over steps and ranks; the rest as
+    means per step and rank.
+    """
+
+    def __init__(self, device: torch.device | str, sum_keys: Iterable[str] = ()):
+        self.device = torch.device(device)
+        self.sum_keys = set(sum_keys)
+        self._device_sums: dict[str, Tensor] = {}
+        self._host_sums: dict[str, float] = {}
+        self.steps = 0
+
+    def update(self, **metrics: Tensor | float) -> None:
+        """Adds one step's worth of metrics."""
+        for name, value in metrics.items():
+            if isinstance(value, Tensor):
+                value = value.detach().to(self.device, torch.float64)
+                total = self._device_sums.get(name)
+                self._device_sums[name] = value if total is None else total + value
+            else:
+                self._host_sums[name] = self._host_sums.get(name, 0.0) + value
+        self.steps += 1
+
+    def flush(self) -> dict[str, float]:
+        """Reduced metrics since the last flush; empty if nothing was added."""
+        if self.steps == 0:
+            return {}
+        names = list(self._device_sums) + list(self._host_sums)
+        host = torch.tensor(list(self._host_sums.values()), dtype=torch.float64)
+        stats = torch.cat(
+            [
+                torch.stack(list(self._device_sums.values()))
+                if self._device_sums
+                else host.new_empty(0).to(self.device),
+                host.to(self.device, non_blocking=True),
+            ]
+        )
+        world_size = 1
+        if dist.is_initialized() and dist.get_world_size() > 1:
+            dist.all_reduce(stats)
+            world_size = dist.get_world_size()
+
+        count = self.steps * world_size
+        metrics = {
+            name: value if name in self.sum_keys else value / count
+            for name, value in zip(names, stats.tolist())
+        }
+        self._device_sums.clear()
+        self._host_sums.clear()
+        self.steps = 0
+        return metrics
@@ -1,10 +1,12 @@
 """Cowboy's transformer-based next-token prediction language model."""
 
+import math
 from typing import Optional
 import torch
 import torch.nn.functional as F
 from torch import Tensor, nn
 
+from ttlm.kv_cache import KVCache, LayerKVCache
 from ttlm.tokenizer.base import Tokenizer
 
 
@@ -46,9 +48,96 @@ class SwiGLU(nn.Module):
         return self.down_proj(gate * up)
 
 
+class MoESwiGLU(nn.Module):
+    """Sparse mixture of SwiGLU experts with top-k token routing.
+
+    Expert weights are stacked into `[num_experts, ...]` parameters. Tokens
+    are sorted by their routed expert into a `[num_experts, capacity, dim]`
+    buffer, so all experts run as three batched matmuls. In training each
+    expert takes at most `capacity_factor * tokens * top_k / num_experts`
+    tokens and the overflow is dropped (it still passes through the residual
+    path); at inference no token is dropped. After every forward `aux_loss`
+    holds the Switch-style load-balancing loss.
+    """
+
+    def __init__(
+        self,
+        hidden_dim: int,
+        intermediate_size: int,
+        num_experts: int,
+        top_k: int = 2,
+        capacity_factor: float = 1.25,
+    ):
+        super().__init__()
+        if not 1 <= top_k <= num_experts:
+            raise ValueError(
+                f"top_k must be between 1 and num_experts ({num_experts}), got {top_k}"
+            )
+        self.num_experts = num_experts
+        self.top_k = top_k
+        self.capacity_factor = capacity_factor
+        self.router = nn.Linear(hidden_dim, num_experts, bias=False)
+        self.gate_proj = nn.Parameter(torch.empty(num_experts, hidden_dim, intermediate_size))
+        self.up_proj = nn.Parameter(torch.empty(num_experts, hidden_dim, intermediate_size))
+        self.down_proj = nn.Parameter(torch.empty(num_experts, intermediate_size, hidden_dim))
+        for weight in (self.gate_proj, self.up_proj, self.down_proj):
+            nn.init.normal_(weight, mean=0.0, std=0.02)
+        self.aux_loss = torch.zeros(())
+
+    def forward(self, x: Tensor) -> Tensor:
+        """Routes each token to its top-k experts and mixes their outputs."""
+        shape = x.shape
+        tokens = x.reshape(-1, shape[-1])
+        num_tokens = tokens.size(0)
+
+        probs = F.softmax(self.router(tokens).float(), dim=-1)
+        weights, experts = probs.topk(self.top_k, dim=-1)
+        # Top-1 keeps the raw router probability: renormalized it would always
+        # be 1 and the router would get no gradient.
+        if self.top_k > 1:
+            weights = weights / weights.sum(dim=-1, keepdim=True)
+
+        # Fraction of routed slots per expert times its mean router probability.
+        counts = torch.bincount(experts.flatten(), minlength=self.num_experts)
+        self.aux_loss = self.num_experts * torch.dot(
+            counts.float() / experts.numel(), probs.mean(dim=0)
+        )
+
+        if self.training:
+            capacity = math.ceil(
+                self.capacity_factor * num_tokens * self.top_k / self.num_experts
+            )
+        else:
+            # Nothing is dropped at inference; size the buffer to the busiest expert.
+            capacity = int(counts.max())
+        # Sort (token, expert) assignments by expert; each gets a slot in
+        # arrival order and slots beyond the capacity are dropped.
+        flat_experts = experts.flatten()
+        order = torch.argsort(flat_experts, stable=True)
+        sorted_experts = flat_experts[order]
+        starts = torch.cumsum(counts, dim=0) - counts
+        slots = torch.arange(order.numel(), device=x.device) - starts[sorted_experts]
+        keep = slots < capacity
+        order, sorted_experts, slots = order[keep], sorted_experts[keep], slots[keep]
+        token_ids = order // self.top_k
+
+        buffer = tokens.new_zeros(self.num_experts, capacity, shape[-1])
+        buffer[sorted_experts, slots] = tokens[token_ids]
+        hidden = F.silu(torch.bmm(buffer, self.gate_proj)) * torch.bmm(buffer, self.up_proj)
+        expert_out = torch.bmm(hidden, self.down_proj)
+
+        routed = expert_out[sorted_experts, slots] * weights.flatten()[order, None]
+        out = routed.new_zeros(num_tokens, shape[-1]).index_add_(0, token_ids, routed)
+        return out.type_as(x).view(shape)
+
+
 class RotaryEmbedding(nn.Module):
     """Rotary Position Embeddings (RoPE) layer."""
 
+    # Positions past this are computed on the fly instead of cached, so long
+    # generations do not grow the cos/sin tables without bound.
+    max_cached_positions = 8192
+
     def __init__(self, head_dim: int, rope_theta: float = 10000.0):
         """Initializes the RotaryEmbedding layer."""
         super().__init__()
@@ -76,31 +165,52 @@ class RotaryEmbedding(nn.Module):
         """Updates the cache if the sequence length has changed."""
         if seq_len > self._cached_seq_len:
             self._cached_seq_len = seq_len
-            positions = torch.arange(
-                seq_len, device=self.inv_freq.device, dtype=torch.float32
-            )
-            freqs = torch.outer(positions, self.inv_freq)
-            emb = torch.cat((freqs, freqs), dim=-1)
-            self._cos_cache = emb.cos()
-            self._sin_cache = emb.sin()
+            # Build the cache as normal tensors even when first reached under
+            # inference_mode (evaluation, scoring), so training can reuse it.
+            with torch.inference_mode(False):
+                positions = torch.arange(
+                    seq_len, device=self.inv_freq.device, dtype=torch.float32
+                )
+                freqs = torch.outer(positions, self.inv_freq.clone())
+                emb = torch.cat((freqs, freqs), dim=-1)
+                self._cos_cache = emb.cos()
+                self._sin_cache = emb.sin()
+
+    def _cos_sin(self, offset: int, seq_len: int) -> tuple[Tensor, Tensor]:
+        """cos/sin tables for positions `offset` to `offset + seq_len`."""
+        end = offset + seq_len
+        # Traced programs (torch.export) compute the tables from the symbolic
+        # offset instead of baking in, and mutating, the Python-side cache.
+        cacheable = end <= max(self._cached_seq_len, self.max_cached_positions)
+        if cacheable and not torch.compiler.is_compiling():
+            self._update_cache(end)
+            return self._cos_cache[offset:end], self._sin_cache[offset:end]
+        positions = torch.arange(
+            offset, end, device=self.inv_freq.device, dtype=torch.float32
+        )
+        freqs = torch.outer(positions, self.inv_freq)
+        emb = torch.cat((freqs, freqs), dim=-1)
+        return emb.cos(), emb.sin()
 
-    def forward(self, q: Tensor, k: Tensor) -> tuple[Tensor, Tensor]:
-        """Applies RoPE to the query and key tensors."""
+    def forward(self, q: Tensor, k: Tensor, offset: int = 0) -> tuple[Tensor, Tensor]:
+        """Applies RoPE to the query and key tensors, starting at position `offset`."""
         _, _, seq_len, _ = q.shape
-        self._update_cache(seq_len)
-        cos = (
-            self._cos_cache[:seq_len].to(q.dtype).unsqueeze(0).unsqueeze(0)
-        )  # Shape: [1, 1, seq_len, head_dim]
-        sin = (
-            self._sin_cache[:seq_len].to(q.dtype).unsqueeze(0).unsqueeze(0)
-        )  # Shape: [1, 1, seq_len, head_dim]
+        cos, sin = self._cos_sin(offset, seq_len)
+        cos = cos.to(q.dtype).unsqueeze(0).unsqueeze(0)  # Shape: [1, 1, seq_len, head_dim]
+        sin = sin.to(q.dtype).unsqueeze(0).unsqueeze(0)  # Shape: [1, 1, seq_len, head_dim]
         q_rotated = (q * cos) + (self._rotate_half(q) * sin)
         k_rotated = (k * cos) + (self._rotate_half(k) * sin)
         return q_rotated, k_rotated
 
 
 class Attention(nn.Module):
-    """Multi-head self-attention with rotary embeddings for autoregressive models."""
+    """Multi-head self-attention with rotary embeddings for autoregressive models.
+
+    With `window_size`, each query only attends to itself and the previous
+    `window_size - 1` positions (sliding-window attention). With `num_kv_heads`
+    below `num_heads`, groups of query heads share one key/value head
+    (grouped-query attention; multi-query for a single KV head).
+    """
 
     def __init__(
         self,
@@ -109,30 +219,75 @@ class Attention(nn.Module):
         dropout: float = 0.1,
         rope_theta: float = 10000.0,
         attn_bias: bool = False,
+        window_size: int | None = None,
+        num_kv_heads: int | None = None,
     ):
         super().__init__()
+        num_kv_heads = num_kv_heads or num_heads
         if hidden_dim % num_heads != 0:
             raise ValueError("hidden_dim must be divisible by num_heads")
+        if num_heads % num_kv_heads != 0:
+            raise ValueError("num_heads must be divisible by num_kv_heads")
+        if window_size is not None and window_size < 1:
+            raise ValueError(f"window_size must be positive, but got {window_size}")
         self.hidden_dim = hidden_dim
         self.num_heads = num_heads
+        self.num_kv_heads = num_kv_heads
+        self.window_size = window_size
         self.head_dim = hidden_dim // num_heads
+        kv_dim = num_kv_heads * self.head_dim
         self.q_proj = nn.Linear(hidden_dim, hidden_dim, bias=attn_bias)
-        self.k_proj = nn.Linear(hidden_dim, hidden_dim, bias=attn_bias)
-        self.v_proj = nn.Linear(hidden_dim, hidden_dim, bias=attn_bias)
+        self.k_proj = nn.Linear(hidden_dim, kv_dim, bias=attn_bias)
+        self.v_proj = nn.Linear(hidden_dim, kv_dim, bias=attn_bias)
         self.o_proj = nn.Linear(hidden_dim, hidden_dim, bias=attn_bias)
         self.rotary_emb = RotaryEmbedding(self.head_dim, rope_theta=rope_theta)
         self.dropout = nn.Dropout(dropout)
         self.scale_attention = RMSNorm(self.head_dim)
 
-    def forward(self, x: Tensor) -> Tensor:
-        """Applies rotary self-attention with causal masking."""
+    def _attn_mask(self, q_pos: Tensor, k_pos: Tensor) -> Tensor:
+        """Boolean [q, k] mask: causal, within the window, and over filled slots."""
+        q_pos, k_pos = q_pos[:, None], k_pos[None, :]
+        mask = (k_pos <= q_pos) & (k_pos >= 0)
+        if self.window_size is not None:
+            mask &= k_pos > q_pos - self.window_size
+        return mask
+
+    def forward(
+        self, x: Tensor, cache: LayerKVCache | None = None, offset: int = 0
+    ) -> Tensor:
+        """Applies rotary self-attention with causal masking.
+
+        With a `cache`, `x` holds the positions from `offset` on; its keys and
+        values are appended to the cache and attention covers the cached ones.
+        """
         b, n, _ = x.shape
         q = self.q_proj(x).view(b, n, self.num_heads, self.head_dim).transpose(1, 2)
-        k = self.k_proj(x).view(b, n, self.num_heads, self.head_dim).transpose(1, 2)
-        v = self.v_proj(x).view(b, n, self.num_heads, self.head_dim).transpose(1, 2)
-        q, k = self.rotary_emb(q, k)
+        k = self.k_proj(x).view(b, n, self.num_kv_heads, self.head_dim).transpose(1, 2)
+        v = self.v_proj(x).view(b, n, self.num_kv_heads, self.head_dim).transpose(1, 2)
+        enable_gqa = self.num_kv_heads != self.num_heads
+        q, k = self.rotary_emb(q, k, offset=offset)
         q, k = self.scale_attention(q), self.scale_attention(k)  # QK norm
-        attn_out = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+        if cache is None and self.window_size is None:
+            attn_out = F.scaled_dot_product_attention(
+                q, k, v, is_causal=True, enable_gqa=enable_gqa
+            )
+        else:
+            q_pos = torch.arange(offset, offset + n, device=x.device)
+            k_pos = q_pos
+            if cache is not None:
+                k, v, k_pos = cache.update(k, v, q_pos)
+            attn_mask = None
+            # Under tracing `n` may be symbolic, so always mask (a no-op for n == 1).
+            if (
+                cache is None
+                or self.window_size is not None
+                or torch.compiler.is_compiling()
+                or n > 1
+            ):
+                attn_mask = self._attn_mask(q_pos, k_pos)
+            attn_out = F.scaled_dot_product_attention(
+                q, k, v, attn_mask=attn_mask, enable_gqa=enable_gqa
+            )
         attn_out = attn_out.transpose(1, 2).contiguous().view(b, n, self.hidden_dim)
         return self.dropout(self.o_proj(attn_out))
 
@@ -148,6 +303,11 @@ class TransformerBlock(nn.Module):
         dropout: float = 0.1,
         attn_bias: bool = False,
         ff_bias: bool = False,
+        window_size: int | None = None,
+        num_kv_heads: int | None = None,
+        num_experts: int | None = None,
+        moe_top_k: int = 2,
+        moe_capacity_factor: float = 1.25,
     ):
         super().__init__()
         self.pre_norm = RMSNorm(hidden_dim)
@@ -156,15 +316,28 @@ class TransformerBlock(nn.Module):
             num_heads=num_heads,
             dropout=dropout,
             attn_bias=attn_bias,
+            window_size=window_size,
+            num_kv_heads=num_kv_heads,
         )
         self.post_norm = RMSNorm(hidden_dim)
-        self.mlp = SwiGLU(hidden_dim, ff_dim, bias=ff_bias)
+        if num_experts is not None and num_experts > 1:
+            self.mlp = MoESwiGLU(
+                hidden_dim,
+                ff_dim,
+                num_experts=num_experts,
+                top_k=moe_top_k,
+                capacity_factor=moe_capacity_factor,
+            )
+        else:
+            self.mlp = SwiGLU(hidden_dim, ff_dim, bias=ff_bias)
 
-    def forward(self, x: Tensor) -> Tensor:
+    def forward(
+        self, x: Tensor, cache: LayerKVCache | None = None, offset: int = 0
+    ) -> Tensor:
         """Applies pre-norm rotary attention and SwiGLU MLP."""
         residual = x
         x = self.pre_norm(x)
-        x = self.self_attn(x)
+        x = self.self_attn(x, cache=cache, offset=offset)
         x = residual + x
         residual = x
         x = self.post_norm(x)
@@ -184,16 +357,38 @@ class Model(nn.Module):
         ff_dim: int,
         dropout: float = 0.1,
         softcap: float = 15.0,
+        window_size: int | list[int | None] | None = None,
+        num_kv_heads: int | None = None,
+        num_experts: int | list[int | None] | None = None,
+        moe_top_k: int = 2,
+        moe_capacity_factor: float = 1.25,
     ):
         super().__init__()
+        if window_size is None or isinstance(window_size, int):
+            window_size = [window_size] * num_layers
+        if len(window_size) != num_layers:
+            raise ValueError(
+                f"Got {len(window_size)} window sizes for {num_layers} layers"
+            )
+        if num_experts is None or isinstance(num_experts, int):
+            num_experts = [num_experts] * num_layers
+        if len(num_experts) != num_layers:
+            raise ValueError(
+                f"Got {len(num_experts)} expert counts for {num_layers} layers"
+            )
 
         self.vocab_size = vocab_size
         self.hidden_dim = hidden_dim
         self.num_layers = num_layers
         self.num_heads = num_heads
+        self.num_kv_heads = num_kv_heads or num_heads
         self.ff_dim = ff_dim
         self.dropout = dropout
         self.softcap = softcap
+        self.window_sizes = list(window_size)
+        self.num_experts = list(num_experts)
+        self.moe_top_k = moe_top_k
+        self.moe_capacity_factor = moe_capacity_factor
         self.flash_attention = False
         self.init_std = 0.02
         self.embeddings = nn.Embedding(vocab_size, hidden_dim)
@@ -205,8 +400,15 @@ class Model(nn.Module):
                     num_heads=num_heads,
                     ff_dim=ff_dim,
                     dropout=dropout,
+                    window_size=layer_window,
+                    num_kv_heads=self.num_kv_heads,
+                    num_experts=layer_experts,
+                    moe_top_k=moe_top_k,
+                    moe_capacity_factor=moe_capacity_factor,
+                )
+                for layer_window, layer_experts in zip(
+                    self.window_sizes, self.num_experts
                 )
-                for _ in range(num_layers)
             ]
         )
 
@@ -232,6 +434,15 @@ class Model(nn.Module):
         """Number of parameters in the model."""
         return sum(p.numel() for p in self.parameters())
 
+    def aux_loss(self) -> Tensor:
+        """Sum of the load-balancing losses of the MoE layers in the last forward."""
+        losses = [
+            block.mlp.aux_loss
+            for block in self.blocks
+            if isinstance(block.mlp, MoESwiGLU)
+        ]
+        return sum(losses) if losses else torch.zeros((), device=self.lm_head.weight.device)
+
     def to_ckpt(self, path: str, tokenizer: Tokenizer) -> None:
         """Saves model state and config to a checkpoint file."""
         checkpoint = {
@@ -242,9 +453,14 @@ class Model(nn.Module):
                 "hidden_dim": self.hidden_dim,
                 "num_layers": self.num_layers,
                 "num_heads": self.num_heads,
+                "num_kv_heads": self.num_kv_heads,
                 "ff_dim": self.ff_dim,
                 "dropout": self.dropout,
                 "softcap": self.softcap,
+                "window_size": self.window_sizes,
+                "num_experts": self.num_experts,
+                "moe_top_k": self.moe_top_k,
+                "moe_capacity_factor": self.moe_capacity_factor,
             },
         }
         torch.save(checkpoint, path)
@@ -262,17 +478,35 @@ class Model(nn.Module):
             ff_dim=config["ff_dim"],
             dropout=config["dropout"],
             softcap=config["softcap"],
+            window_size=config.get("window_size"),
+            num_kv_heads=config.get("num_kv_heads"),
+            num_experts=config.get("num_experts"),
+            moe_top_k=config.get("moe_top_k", 2),
+            moe_capacity_factor=config.get("moe_capacity_factor", 1.25),
         )
         model.load_state_dict(checkpoint["state_dict"])
         tokenizer = checkpoint["tokenizer"]
         return model, tokenizer
 
-    def forward(self, input_ids: Tensor) -> dict[str, Tensor]:
-        """Forward pass returning logits."""
+    def hidden_states(self, input_ids: Tensor, cache: KVCache | None = None) -> Tensor:
+        """Final normalized hidden states, before the LM head.
+
+        With a `cache`, `input_ids` continues the cached sequence and the cache
+        is advanced past it.
+        """
+        offset = 0 if cache is None else cache.seq_len
         x = self.embeddings(input_ids)
-        for block in self.blocks:
-            x = block(x)
-        x = self.norm(x)
-        logits = self.lm_head(x)
-        logits = self.softcap * torch.tanh(logits / self.softcap)
-        return logits
+        for i, block in enumerate(self.blocks):
+            x = block(x, cache=None if cache is None else cache[i], offset=offset)
+        if cache is not None:
+            cache.seq_len += input_ids.size(1)
+        return self.norm(x)
+
+    def project(self, hidden: Tensor) -> Tensor:
+        """Maps hidden states to softcapped logits."""
+        logits = self.lm_head(hidden)
+        return self.softcap * torch.tanh(logits / self.softcap)
+
+    def forward(self, input_ids: Tensor, cache: KVCache | None = None) -> dict[str, Tensor]:
+        """Forward pass returning logits."""
+        return self.project(self.hidden_states(input_ids, cache=cache))
@@ -0,0 +1,65 @@
+"""Optimizer construction and gradient-norm helpers."""
+
+from collections.abc import Iterable
+
+import torch
+from torch import Tensor, nn
+
+from ttlm.config import OptimizerConfig
+
+
+def param_groups(model: nn.Module, weight_decay: float) -> list[dict]:
+    """Splits trainable parameters into decay and no-decay groups.
+
+    Only matrices of linear layers are decayed. Norm weights, biases and
+    embeddings (including an output head tied to them) are not; tied
+    parameters are listed once.
+    """
+    embeddings = {
+        id(p)
+        for module in model.modules()
+        if isinstance(module, nn.Embedding)
+        for p in module.parameters()
+    }
+    decay, no_decay = [], []
+    for p in model.parameters():
+        if not p.requires_grad:
+            continue
+        if p.ndim < 2 or id(p) in embeddings:
+            no_decay.append(p)
+        else:
+            decay.append(p)
+    return [
+        {"params": decay, "weight_decay": weight_decay},
+        {"params": no_decay, "weight_decay": 0.0},
+    ]
+
+
+def build_optimizer(model: nn.Module, config: OptimizerConfig) -> torch.optim.Optimizer:
+    """The optimizer described by `config`, using its multi-tensor implementation.
+
+    `fused` runs the whole update as a few fused kernels, `foreach` batches it
+    over lists of tensors, and `for_loop` is the reference per-parameter loop.
+    """
+    if config.name != "adamw":
+        raise ValueError(f"Unknown optimizer: {config.name}")
+    return torch.optim.AdamW(
+        param_groups(model, config.weight_decay),
+        lr=config.learning_rate,
+        betas=config.betas,
+        eps=config.eps,
+        fused=config.implementation == "fused",
+        foreach=config.implementation == "foreach",
+    )
+
+
+def clip_grad_norm(parameters: Iterable[Tensor], max_norm: float | None) -> Tensor:
+    """Total gradient norm, clipping to `max_norm` unless it is None.
+
+    The norm is one multi-tensor reduction kept on device, so it can be
+    logged without synchronising.
+    """
+    if max_norm is None:
+        grads = [p.grad for p in parameters if p.grad is not None]
+        return torch.nn.utils.get_total_norm(grads, foreach=True)
+    return torch.nn.utils.clip_grad_norm_(parameters, max_norm, foreach=True)
@@ -0,0 +1,168 @@
+"""Radix-tree cache of prompt KV state shared across requests."""
+
+import itertools
+from collections.abc import Sequence
+
+import torch
+from torch import Tensor
+
+from ttlm.kv_cache import KVCache
+
+
+class _Node:
+    """A radix-tree edge: a run of tokens and their per-layer keys/values."""
+
+    __slots__ = ("tokens", "keys", "values", "children", "parent", "last_access")
+
+    def __init__(
+        self,
+        tokens: tuple[int, ...],
+        keys: list[Tensor],
+        values: list[Tensor],
+        parent: "_Node | None",
+    ):
+        self.tokens = tokens
+        self.keys = keys  # per layer: [num_kv_heads, len(tokens), head_dim]
+        self.values = values
+        self.children: dict[int, _Node] = {}
+        self.parent = parent
+        self.last_access = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(t.numel() * t.element_size() for t in self.keys + self.values)
+
+    def split(self, at: int) -> "_Node":
+        """Splits this edge after `at` tokens, returning the new upper node."""
+        # Copy both halves so each node owns its storage and eviction frees it.
+        upper = _Node(
+            self.tokens[:at],
+            [k[:, :at].clone() for k in self.keys],
+            [v[:, :at].clone() for v in self.values],
+            self.parent,
+        )
+        upper.last_access = self.last_access
+        self.parent.children[self.tokens[0]] = upper
+        self.tokens = self.tokens[at:]
+        self.keys = [k[:, at:].clone() for k in self.keys]
+        self.values = [v[:, at:].clone() for v in self.values]
+        self.parent = upper
+        upper.children[self.tokens[0]] = self
+        return upper
+
+
+class PrefixCache:
+    """Stores prompt KV blocks keyed by token-id prefixes, with LRU eviction.
+
+    `lookup` seeds a `KVCache` with the longest cached prefix of a prompt so
+    only the suffix needs a prefill, and `insert` adds a prefilled prompt.
+    Least recently used leaves are evicted while the stored keys and values
+    exceed `max_bytes`. Only full-attention layers are supported, since a
+    sliding-window cache drops the keys a shared prefix would need.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._root = _Node((), [], [], None)
+        self._clock = itertools.count(1)
+        self._requests = 0
+        self._hits = 0
+        self._prompt_tokens = 0
+        self._reused_tokens = 0
+        self._evictions = 0
+
+    def _match(self, tokens: Sequence[int]) -> list[tuple[_Node, int]]:
+        """Nodes along the longest cached prefix, with how many tokens each matches."""
+        path, node, pos = [], self._root, 0
+        while pos < len(tokens) and (child := node.children.get(tokens[pos])):
+            n = 0
+            for a, b in zip(child.tokens, tokens[pos:]):
+                if a != b:
+                    break
+                n += 1
+            path.append((child, n))
+            pos += n
+            if n < len(child.tokens):
+                break
+            node = child
+        return path
+
+    def lookup(self, model, tokens: Sequence[int]) -> tuple[KVCache, int]:
+        """A cache seeded with the longest cached prefix of `tokens`, and its length.
+
+        At least the last token is always left uncached, so the caller's prefill
+        still produces logits for the next position.
+        """
+        if any(w is not None for w in model.window_sizes):
+            raise ValueError("Prefix caching requires full-attention layers")
+        tokens = list(tokens)[:-1]
+        cache = KVCache.for_model(model)
+        path = self._match(tokens)
+        matched = sum(n for _, n in path)
+
+        self._requests += 1
+        self._prompt_tokens += len(tokens) + 1
+        if matched:
+            self._hits += 1
+            self._reused_tokens += matched
+            now = next(self._clock)
+            for node, _ in path:
+                node.last_access = now
+            for i, layer in enumerate(cache.layers):
+                keys = torch.cat([node.keys[i][:, :n] for node, n in path], dim=1)
+                values = torch.cat([node.values[i][:, :n] for node, n in path], dim=1)
+                positions = torch.arange(matched, device=keys.device)
+                layer.update(keys[None], values[None], positions)
+            cache.seq_len = matched
+        return cache, matched
+
+    def insert(self, tokens: Sequence[int], cache: KVCache) -> None:
+        """Adds the KV state of `tokens`, held in the first row of `cache`."""
+        tokens = tuple(tokens)[: cache.seq_len]
+        node, pos, now = self._root, 0, next(self._clock)
+        for child, n in self._match(tokens):
+            if n < len(child.tokens):
+                child = child.split(n)
+            child.last_access = now
+            node, pos = child, pos + n
+
+        if pos < len(tokens):
+            leaf = _Node(
+                tokens[pos:],
+                [layer.keys[0, :, pos : len(tokens)].clone() for layer in cache.layers],
+                [layer.values[0, :, pos : len(tokens)].clone() for layer in cache.layers],
+                node,
+            )
+            leaf.last_access = now
+            node.children[leaf.tokens[0]] = leaf
+            self.nbytes += leaf.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drops least recently used leaves until under the memory cap."""
+        while self.nbytes > self.max_bytes:
+            leaves, stack = [], list(self._root.children.values())
+            while stack:
+                node = stack.pop()
+                if node.children:
+                    stack.extend(node.children.values())
+                else:
+                    leaves.append(node)
+            if not leaves:
+                return
+            victim = min(leaves, key=lambda node: node.last_access)
+            del victim.parent.children[victim.tokens[0]]
+            self.nbytes -= victim.nbytes
+            self._evictions += 1
+
+    def stats(self) -> dict[str, float]:
+        """Hit-rate and memory statistics."""
+        return {
+            "requests": self._requests,
+            "hit_rate": self._hits / max(1, self._requests),
+            "token_hit_rate": self._reused_tokens / max(1, self._prompt_tokens),
+            "reused_tokens": self._reused_tokens,
+            "nbytes": self.nbytes,
+            "evictions": self._evictions,
+        }
@@ -0,0 +1,82 @@
+"""Config-driven wrappers around `torch.profiler`."""
+
+import os
+from contextlib import AbstractContextManager
+from types import TracebackType
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function, schedule
+
+from ttlm.config import ProfilerConfig
+
+__all__ = ["build_profiler", "record_function"]
+
+
+class NullProfiler(AbstractContextManager):
+    """Stand-in used when profiling is disabled, so call sites stay branch-free."""
+
+    def step(self) -> None:
+        """No-op."""
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        """No-op."""
+
+
+def _trace_handler(
+    config: ProfilerConfig, output_dir: str, rank: int, use_cuda: bool
+):
+    """Return an `on_trace_ready` callback exporting a Chrome trace and a table."""
+    sort_by = config.sort_by or (
+        "self_cuda_time_total" if use_cuda else "self_cpu_time_total"
+    )
+
+    def handler(prof: profile) -> None:
+        os.makedirs(output_dir, exist_ok=True)
+        stem = os.path.join(output_dir, f"rank{rank}_step{prof.step_num}")
+        prof.export_chrome_trace(f"{stem}.json")
+        table = prof.key_averages().table(sort_by=sort_by, row_limit=config.row_limit)
+        with open(f"{stem}.txt", "w") as f:
+            f.write(table)
+
+    return handler
+
+
+def build_profiler(
+    config: ProfilerConfig,
+    output_dir: str,
+    rank: int = 0,
+    device: torch.device | str = "cpu",
+) -> profile | NullProfiler:
+    """Build a profiler for the wait/warmup/active window described by `config`.
+
+    Call `.step()` once per training (or generation) step. Each completed
+    window writes `rank{rank}_step{n}.json` (Chrome trace, open in
+    chrome://tracing or Perfetto) and `rank{rank}_step{n}.txt` (key averages)
+    to `output_dir`.
+    """
+    if not config.enabled:
+        return NullProfiler()
+
+    use_cuda = torch.device(device).type == "cuda" and torch.cuda.is_available()
+    activities = [ProfilerActivity.CPU]
+    if use_cuda:
+        activities.append(ProfilerActivity.CUDA)
+
+    return profile(
+        activities=activities,
+        schedule=schedule(
+            wait=config.wait,
+            warmup=config.warmup,
+            active=config.active,
+            repeat=config.repeat,
+        ),
+        on_trace_ready=_trace_handler(config, output_dir, rank, use_cuda),
+        record_shapes=config.record_shapes,
+        profile_memory=config.profile_memory,
+        with_stack=config.with_stack,
+    )
@@ -0,0 +1,135 @@
+"""Batched next-token sampling with per-row parameters."""
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import torch
+import torch.nn.functional as F
+from torch import Tensor
+
+
+def _per_row(
+    value: float | Sequence[float] | Tensor,
+    batch_size: int,
+    dtype: torch.dtype,
+    device: torch.device | str,
+) -> Tensor:
+    """Broadcasts a scalar or per-row sequence to a `[batch_size]` tensor."""
+    tensor = torch.as_tensor(value, dtype=dtype, device=device)
+    return tensor.expand(batch_size).contiguous() if tensor.dim() == 0 else tensor
+
+
+@dataclass
+class SamplingParams:
+    """Per-row sampling parameters, each a `[batch]` tensor.
+
+    A temperature of 0 selects greedy decoding for that row. `top_k=0`,
+    `top_p=1`, `min_p=0` and `repetition_penalty=1` disable the filter.
+    `max_top_k` is the largest `top_k` when every row sets one; the sampler
+    then only ranks that many candidates instead of sorting the vocabulary.
+    """
+
+    temperature: Tensor
+    top_k: Tensor
+    top_p: Tensor
+    min_p: Tensor
+    repetition_penalty: Tensor
+    max_top_k: int | None = None
+
+    @classmethod
+    def create(
+        cls,
+        batch_size: int,
+        temperature: float | Sequence[float] = 1.0,
+        top_k: int | Sequence[int] | None = None,
+        top_p: float | Sequence[float] = 1.0,
+        min_p: float | Sequence[float] = 0.0,
+        repetition_penalty: float | Sequence[float] = 1.0,
+        device: torch.device | str = "cpu",
+    ) -> "SamplingParams":
+        """Builds parameters from scalars (shared by all rows) or per-row values."""
+        top_k = _per_row(top_k or 0, batch_size, torch.long, "cpu")
+        return cls(
+            temperature=_per_row(temperature, batch_size, torch.float32, device),
+            top_k=top_k.to(device),
+            top_p=_per_row(top_p, batch_size, torch.float32, device),
+            min_p=_per_row(min_p, batch_size, torch.float32, device),
+            repetition_penalty=_per_row(
+                repetition_penalty, batch_size, torch.float32, device
+            ),
+            max_top_k=int(top_k.max()) if bool((top_k > 0).all()) else None,
+        )
+
+
+def make_generators(
+    seeds: int | Sequence[int], batch_size: int, device: torch.device | str = "cpu"
+) -> list[torch.Generator]:
+    """One seeded generator per row; an int seed is offset by the row index."""
+    if isinstance(seeds, int):
+        seeds = [seeds + i for i in range(batch_size)]
+    return [torch.Generator(device=device).manual_seed(s) for s in seeds]
+
+
+def apply_repetition_penalty(
+    logits: Tensor, prev_tokens: Tensor, penalty: Tensor
+) -> Tensor:
+    """CTRL-style penalty on tokens already in `prev_tokens` (`[batch, seq]`)."""
+    scores = logits.gather(1, prev_tokens)
+    penalty = penalty[:, None]
+    scores = torch.where(scores > 0, scores / penalty, scores * penalty)
+    return logits.scatter(1, prev_tokens, scores)
+
+
+def sample(
+    logits: Tensor,
+    params: SamplingParams,
+    generators: Sequence[torch.Generator] | None = None,
+    prev_tokens: Tensor | None = None,
+) -> Tensor:
+    """Samples one token per row of `logits` (`[batch, vocab]`), returns `[batch]`.
+
+    All filters run on one descending sort of the logits (a top-k when every
+    row sets one), and the token is drawn by inverse-CDF lookup with a single
+    uniform number per row, so the whole batch is handled without Python
+    loops over rows. With `generators`, each row draws its number from its
+    own generator, which makes a request reproducible regardless of what it
+    is batched with.
+    """
+    batch_size, vocab_size = logits.shape
+    logits = logits.float()
+    if prev_tokens is not None:
+        logits = apply_repetition_penalty(
+            logits, prev_tokens, params.repetition_penalty
+        )
+
+    greedy = params.temperature <= 0
+    temperature = torch.where(greedy, 1.0, params.temperature)
+    logits = logits / temperature[:, None]
+    if params.max_top_k is not None and params.max_top_k < vocab_size:
+        sorted_logits, sorted_ids = torch.topk(logits, params.max_top_k, dim=-1)
+    else:
+        sorted_logits, sorted_ids = torch.sort(logits, dim=-1, descending=True)
+    probs = F.softmax(sorted_logits, dim=-1)
+    num_candidates = probs.size(-1)
+
+    ranks = torch.arange(num_candidates, device=logits.device)[None, :]
+    top_k = params.top_k[:, None]
+    remove = (top_k > 0) & (ranks >= top_k)
+    probs = probs.masked_fill(remove, 0.0)
+    probs = probs / probs.sum(dim=-1, keepdim=True)
+    # Keep the smallest prefix whose mass reaches top_p, and tokens at least
+    # min_p times as likely as the most likely one. The top token always stays.
+    remove |= (probs.cumsum(dim=-1) - probs) > params.top_p[:, None]
+    remove |= probs < params.min_p[:, None] * probs[:, :1]
+    remove[:, 0] = False
+    cdf = probs.masked_fill(remove, 0.0).cumsum(dim=-1)
+
+    if generators is None:
+        uniform = torch.rand(batch_size, device=logits.device)
+    else:
+        uniform = torch.cat(
+            [torch.rand(1, generator=g, device=g.device) for g in generators]
+        ).to(logits.device)
+    idx = torch.searchsorted(cdf, (uniform * cdf[:, -1])[:, None], right=True)
+    sampled = sorted_ids.gather(1, idx.clamp(max=num_candidates - 1)).squeeze(1)
+    return torch.where(greedy, sorted_ids[:, 0], sampled)
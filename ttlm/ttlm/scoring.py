@@ -0,0 +1,138 @@
+"""Batched log-likelihood scoring of token sequences."""
+
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+import torch
+from torch import Tensor
+from torch.nn.utils.rnn import pad_sequence
+
+from ttlm.tokenizer.base import Tokenizer
+
+
+@dataclass
+class ScoreRequest:
+    """A token sequence whose tokens from position `start` on are scored.
+
+    `start` is at least 1 since the first token has no prediction; set it to
+    the context length to score only a continuation.
+    """
+
+    input_ids: Tensor
+    start: int = 1
+
+
+@dataclass
+class ScoreResult:
+    """Per-token log-probabilities of the scored tokens of one request."""
+
+    token_logprobs: Tensor
+
+    @property
+    def num_tokens(self) -> int:
+        """Number of scored tokens."""
+        return self.token_logprobs.numel()
+
+    @property
+    def logprob(self) -> float:
+        """Total log-probability of the scored tokens."""
+        return self.token_logprobs.sum().item()
+
+    @property
+    def perplexity(self) -> float:
+        """Per-token perplexity of the scored tokens.
+
+        Raises ValueError for a span with no scored tokens.
+        """
+        if self.num_tokens == 0:
+            raise ValueError("Perplexity is undefined for a span with no scored tokens")
+        return torch.exp(-self.token_logprobs.mean()).item()
+
+
+def text_request(tokenizer: Tokenizer, text: str) -> ScoreRequest:
+    """Scores a whole document, including the prediction of its EOS token."""
+    (ids,) = tokenizer.encode([text], bos=True, eos=True)
+    return ScoreRequest(ids)
+
+
+def continuation_request(
+    tokenizer: Tokenizer, context: str, continuation: str
+) -> ScoreRequest:
+    """Scores `continuation` given `context`, e.g. to rank candidate endings."""
+    (context_ids,) = tokenizer.encode([context], bos=True, eos=False)
+    (continuation_ids,) = tokenizer.encode([continuation], bos=False, eos=False)
+    return ScoreRequest(
+        torch.cat([context_ids, continuation_ids]), start=max(1, context_ids.numel())
+    )
+
+
+@torch.inference_mode()
+def token_logprobs(
+    model, input_ids: Tensor, chunk_size: int = 1024
+) -> Tensor:
+    """Log-probability of each next token, shape `[batch, seq_len - 1]`.
+
+    Logits are materialised `chunk_size` positions at a time from the final
+    hidden states, so peak memory is `chunk_size * vocab_size` rather than
+    `batch * seq_len * vocab_size`.
+    """
+    hidden = model.hidden_states(input_ids)[:, :-1]
+    targets = input_ids[:, 1:].reshape(-1)
+    flat_hidden = hidden.reshape(-1, hidden.size(-1))
+    out = torch.empty(targets.numel(), device=input_ids.device, dtype=torch.float32)
+    for start in range(0, targets.numel(), chunk_size):
+        end = start + chunk_size
+        logits = model.project(flat_hidden[start:end]).float()
+        out[start:end] = logits.gather(-1, targets[start:end, None]).squeeze(
+            -1
+        ) - torch.logsumexp(logits, dim=-1)
+    return out.view_as(input_ids[:, 1:])
+
+
+def _length_batches(
+    requests: list[ScoreRequest], max_batch_tokens: int
+) -> Iterator[list[int]]:
+    """Groups request indices by length so padded batches stay under the budget."""
+    order = sorted(range(len(requests)), key=lambda i: requests[i].input_ids.numel())
+    batch: list[int] = []
+    for i in order:
+        width = requests[i].input_ids.numel()
+        if batch and width * (len(batch) + 1) > max_batch_tokens:
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+
+def score(
+    model,
+    requests: Iterable[ScoreRequest],
+    pad_token_id: int,
+    max_batch_tokens: int = 16384,
+    buffer_size: int = 1024,
+    chunk_size: int = 1024,
+    device: torch.device | str = "cpu",
+) -> Iterator[ScoreResult]:
+    """Scores a stream of requests, yielding results in input order.
+
+    Requests are read `buffer_size` at a time, sorted by length and packed
+    into padded batches of at most `max_batch_tokens` tokens, so many short
+    documents share one forward pass with little padding.
+    """
+    model.eval()
+    requests = iter(requests)
+    while buffer := [r for _, r in zip(range(buffer_size), requests)]:
+        results: list[ScoreResult | None] = [None] * len(buffer)
+        for batch in _length_batches(buffer, max_batch_tokens):
+            input_ids = pad_sequence(
+                [buffer[i].input_ids for i in batch],
+                batch_first=True,
+                padding_value=pad_token_id,
+            ).to(device)
+            logprobs = token_logprobs(model, input_ids, chunk_size=chunk_size).cpu()
+            for row, i in enumerate(batch):
+                request = buffer[i]
+                end = request.input_ids.numel() - 1
+                results[i] = ScoreResult(logprobs[row, request.start - 1 : end])
+        yield from results
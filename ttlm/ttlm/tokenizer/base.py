@@ -1,6 +1,11 @@
+from __future__ import annotations
+
 import abc
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING
 
-import torch
+if TYPE_CHECKING:
+    import torch
 
 class Tokenizer(abc.ABC):
     """Abstract base class for tokenizers."""
@@ -83,3 +88,21 @@ class Tokenizer(abc.ABC):
         - PAD token: <PAD>
         """
         pass
+
+    def decode_token(self, token: int, special_tokens: bool = False) -> str:
+        """Decodes a single token id.
+        Subclasses with a direct id-to-text mapping should override this with
+        an O(1) lookup; the default goes through `decode`.
+        """
+        return self.decode([[token]], special_tokens=special_tokens)[0]
+
+    def decode_stream(
+        self, tokens: Iterable[int], special_tokens: bool = False
+    ) -> Iterator[str]:
+        """Incrementally decodes a stream of token ids.
+        Yields the text of each token as soon as it arrives, without
+        re-decoding what came before. Joining the pieces gives `decode`.
+        """
+        for token in tokens:
+            if text := self.decode_token(token, special_tokens=special_tokens):
+                yield text
@@ -1,7 +1,12 @@
-import torch
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
 
 from ttlm.tokenizer.base import Tokenizer
 
+if TYPE_CHECKING:
+    import torch
+
 def tokenize_text(text, vocab, to_id = False, unk_token_id = None):
     token_sizes = set([len(token) for token in vocab])
     token_sizes = sorted(token_sizes)[::-1]
@@ -108,6 +113,8 @@ class BPETokenizer(Tokenizer):
         self, strings: list[str], bos: bool = True, eos: bool = True
     ) -> list[torch.LongTensor]:
         """Encodes a batch of strings to their ASCII values."""
+        import torch
+
         encoded = []
         for s in strings:
             tokens = tokenize_text(s, self.vocab, to_id = True, unk_token_id = self.unk_token_id)
@@ -118,26 +125,28 @@ class BPETokenizer(Tokenizer):
             encoded.append(torch.tensor(tokens, dtype=torch.long))
         return encoded
 
+    def decode_token(self, token: int, special_tokens: bool = False) -> str:
+        """Decodes a single token id in O(1)."""
+        if token < len(self.vocab):
+            return self.vocab[token]
+        if not special_tokens and token in (
+            self.bos_token_id,
+            self.eos_token_id,
+            self.pad_token_id,
+        ):
+            return ""
+        return {
+            self.bos_token_id: self.bos_token,
+            self.eos_token_id: self.eos_token,
+            self.unk_token_id: self.unk_token,
+            self.pad_token_id: self.pad_token,
+        }.get(token, "")
+
     def decode(
         self, tokens: list[list[int]], special_tokens: bool = False
     ) -> list[str]:
-        """Decodes a batch of ASCII values to strings."""
-        decoded = []
-        special_tokens_to_remove = {self.bos_token_id, self.eos_token_id, self.pad_token_id}
-        for token_list in tokens:
-            if not special_tokens:
-                token_list = [t for t in token_list if t not in special_tokens_to_remove]
-            chars = []
-            for token in token_list:
-                if token < len(self.vocab):
-                    chars.append(self.vocab(token))
-                elif token == self.bos_token_id:
-                    chars.append("<BOS>")
-                elif token == self.eos_token_id:
-                    chars.append("<EOS>")
-                elif token == self.unk_token_id:
-                    chars.append("<UNK>")
-                elif token == self.pad_token_id:
-                    chars.append("<PAD>")
-            decoded.append("".join(chars))
-        return decoded
\ No newline at end of file
+        """Decodes a batch of token ids to strings."""
+        return [
+            "".join(self.decode_token(t, special_tokens) for t in token_list)
+            for token_list in tokens
+        ]